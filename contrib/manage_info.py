@@ -49,12 +49,13 @@ def main(argv):
     # list of licenses
     licenses = list()
 
-    for pkg in desc_tree.packages():
-        try:
-            desc = desc_tree[pkg]
-        except exception.DescriptionTreeException as err:
-            print('DescriptionTree error: %s' % err, file=sys.stderr)
-            return 1
+    try:
+        descriptions = list(desc_tree.load_all())
+    except exception.DescriptionException as err:
+        print('Description error: %s' % err, file=sys.stderr)
+        return 1
+
+    for desc in descriptions:
         
         if desc.license not in licenses:
             licenses.append(desc.license)
@@ -11,12 +11,18 @@
 """
 
 __all__ = [
+    'api',
     'config',
+    'daemon',
     'description',
     'description_tree',
+    'distfiles',
+    'download',
     'exception',
     'ebuild',
     'fetch',
+    'index',
+    'metadata',
     'overlay'
 ]
 
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+    api.py
+    ~~~~~~
+    
+    This module implements a Python API with the queries available on the
+    command line interface of g-octave (list, search, info, ...). The
+    queries yield records (dicts) that can be used directly by other
+    Python programs, or written to a file in a machine-readable format.
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'Query',
+    'formats',
+    'write_records',
+]
+
+import json
+
+from .config import Config
+from .description import HgDescription, re_pkg_atom
+from .description_tree import DescriptionTree
+from .exception import DescriptionTreeException
+
+# available output formats for write_records
+formats = ('json', 'jsonl', 'tsv')
+
+
+class Query(object):
+    
+    # fields of the records, in the order used by the tsv format
+    fields = {
+        'list': ('category', 'name', 'versions'),
+        'list_raw': ('atom',),
+        'search': ('name', 'category', 'versions'),
+        'info': (
+            'name', 'version', 'date', 'maintainer', 'description',
+            'categories', 'license', 'url',
+        ),
+        'rdepends': ('atom',),
+    }
+    
+    def __init__(self, conf=None, tree=None):
+        
+        self._config = conf
+        self._tree = tree
+    
+    
+    def tree(self):
+        
+        if self._tree is None:
+            self._tree = DescriptionTree(conf = self._config)
+        return self._tree
+    
+    
+    def config(self, key):
+        
+        if self._config is None:
+            self._config = Config(True)
+        return self._config.__getattr__(key)
+    
+    
+    def list(self):
+        
+        tree = self.tree()
+        for category in sorted(tree.pkg_list):
+            names = set([pkg['name'] for pkg in tree.pkg_list[category]])
+            for name in sorted(names):
+                yield {
+                    'category': category,
+                    'name': name,
+                    'versions': tree.package_versions(name) + ['9999'],
+                }
+    
+    
+    def list_raw(self):
+        
+        for atom in self.tree().packages():
+            yield {'atom': atom}
+    
+    
+    def search(self, term):
+        
+        tree = self.tree()
+        for name, versions in tree.search(term):
+            yield {
+                'name': name,
+                'category': tree.categories[name],
+                'versions': versions,
+            }
+    
+    
+    def info(self, pkg, scm=False):
+        
+        tree = self.tree()
+        
+        atom = re_pkg_atom.match(pkg)
+        if atom is None:
+            name, version = pkg, tree.latest_version(pkg)
+        else:
+            name, version = atom.group(1), atom.group(2)
+        
+        if scm:
+            category = tree.categories.get(name, None)
+            if category is None:
+                raise DescriptionTreeException('Package not found: %s' % pkg)
+            desc = HgDescription(category, name, self._config)
+        else:
+            desc = tree['%s-%s' % (name, version)]
+            if desc is None:
+                raise DescriptionTreeException('Package not found: %s' % pkg)
+        
+        record = {}
+        for field in self.fields['info']:
+            record[field] = getattr(desc, field)
+        return record
+    
+    
+    def rdepends(self, pkgname):
+        
+        for atom in self.tree().rdepends(pkgname):
+            yield {'atom': atom}
+
+
+def _tsv_value(value):
+    
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        value = ','.join(value)
+    # tabs and newlines are the separators
+    return ' '.join(value.split())
+
+
+def write_records(records, format, fields, fp):
+    """writes the *records* to the file-like object *fp*, as soon as they
+    are generated. *fields* is the list of fields of the records, used by
+    the tsv format.
+    """
+    
+    if format not in formats:
+        raise ValueError('Invalid format: %s' % format)
+    
+    if format == 'json':
+        fp.write('[')
+    
+    first = True
+    for record in records:
+        if format == 'tsv':
+            fp.write('\t'.join([_tsv_value(record.get(i)) for i in fields]))
+            fp.write('\n')
+        elif format == 'jsonl':
+            fp.write(json.dumps(record, sort_keys=True))
+            fp.write('\n')
+        else:
+            fp.write(first and '\n' or ',\n')
+            fp.write(json.dumps(record, sort_keys=True))
+        first = False
+    
+    if format == 'json':
+        fp.write('\n]\n')
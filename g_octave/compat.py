@@ -14,15 +14,41 @@
 __all__ = [
     'py3k',
     'open',
+    'atomic_open',
+    'StringIO',
 ]
 
 import codecs
+import contextlib
+import os
 import sys
 
 py3k = sys.version_info >= (3, 0)
 
+# file-like object for the native strings, like sys.stdout
+if py3k:
+    from io import StringIO
+else:
+    from StringIO import StringIO
+
 def open(filename, mode='r', encoding='utf-8'):
     try:
         return codecs.open(filename, mode=mode, encoding=encoding)
     except:
         return codecs.open(filename, mode=mode, encoding='iso-8859-15')
+
+@contextlib.contextmanager
+def atomic_open(filename, mode='w', encoding='utf-8'):
+    """opens a temporary file, that replaces *filename* when the block
+    ends, so the file is never read while incomplete. the temporary file
+    is removed if the block fails.
+    """
+    temp = filename + '.tmp'
+    fp = open(temp, mode, encoding)
+    try:
+        with fp:
+            yield fp
+    except BaseException:
+        os.unlink(temp)
+        raise
+    os.rename(temp, filename)
@@ -38,7 +38,11 @@ class Config(object):
         'log_level': '',
         'log_file': '/var/log/g-octave.log',
         'package_manager': 'portage',
+        'command_timeout': '',
         'use_scm': 'false',
+        'binpkg': 'false',
+        'scm_cache_ttl': '3600',
+        'daemon_socket': '/var/run/g-octave.sock',
     }
 
     _section_name = 'main'
@@ -76,10 +80,18 @@ class Config(object):
         self._cache = {}
         self._info = {}
 
-        if not fetch_phase:
+        self.reload()
+
+
+    def reload(self):
+        """(re)loads the JSON file of the package database, that may be
+        changed by a sync.
+        """
+
+        if not self._fetch_phase:
 
             # JSON
-            json_file = os.path.join(_db, 'info.json')
+            json_file = os.path.join(self._getattr('db'), 'info.json')
             with open(json_file) as fp:
                 self._info = json.load(fp)
 
@@ -94,6 +106,16 @@ class Config(object):
             raise ConfigException('Invalid option: %s' % attr)
 
 
+    def __getstate__(self):
+        return self.__dict__
+
+
+    def __setstate__(self, state):
+        # needed to pickle the object, because __getattr__ raises
+        # ConfigException instead of AttributeError
+        self.__dict__.update(state)
+
+
     def _getattr(self, attr):
         from_env = os.environ.get(self._env_namespace + attr.upper(), None)
         if from_env is None:
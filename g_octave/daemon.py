@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+"""
+    daemon.py
+    ~~~~~~~~~
+    
+    This module implements a daemon that keeps the package database and
+    its index loaded in memory, answering the queries of the command line
+    interface (list, search, info, ...) and creating ebuilds, through an
+    Unix domain socket.
+    
+    The protocol is a JSON object per line. The requests are objects like
+    {"command": "search", "args": ["signal"], "options": {}}, and the
+    responses are objects like {"status": "ok", "records": [...]}.
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'Client',
+    'Daemon',
+    'connect',
+]
+
+import json
+import os
+import socket
+import threading
+
+from . import exception
+from .api import Query
+from .compat import py3k
+from .config import Config
+from .exception import DaemonException
+from .index import Index
+
+if py3k:
+    import socketserver
+else:
+    import SocketServer as socketserver
+
+from .log import Log
+log = Log('g_octave.daemon')
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = {'status': 'error', 'error': 'Invalid request'}
+            else:
+                response = self.server.daemon.handle(request)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    
+    daemon_threads = True
+
+
+class Daemon(object):
+    
+    # commands that returns the records of the g_octave.Query methods
+    _queries = ('list', 'list_raw', 'search', 'info', 'rdepends')
+    
+    def __init__(self, conf=None, pkg_manager=None, socket_path=None):
+        
+        if conf is None:
+            conf = Config()
+        self._config = conf
+        self._pkg_manager = pkg_manager
+        self._socket_path = socket_path or conf.daemon_socket
+        self._lock = threading.Lock()
+        self._query = None
+        self._db_key = None
+        self._server = None
+    
+    
+    def _db_changed(self):
+        """returns the key of the package database, if it changed since
+        the last load. the index is the last thing written by a sync.
+        """
+        
+        index = Index(self._config)
+        key = (index.commit_id(), index.mtime())
+        if key != self._db_key:
+            return key
+        return None
+    
+    
+    def query(self):
+        """returns the *g_octave.Query* object, reloading the package
+        database if needed.
+        """
+        
+        key = self._db_changed()
+        if self._query is None or key is not None:
+            log.info('Loading the package database.')
+            # info.json may have changed too
+            self._config.reload()
+            query = Query(self._config)
+            query.tree().index()
+            self._query = query
+            self._db_key = key or self._db_key
+        return self._query
+    
+    
+    def _generate(self, args, force=False, scm=False):
+        
+        from .ebuild import Ebuild, Renderer
+        from .metadata import MetadataCache
+        
+        metadata = MetadataCache(conf = self._config)
+        renderer = Renderer(
+            conf = self._config,
+            index = self._query.tree().index(),
+        )
+        records = []
+        resolved = []
+        for arg in args:
+            # the ebuild files of the package and of its dependencies, not
+            # returned with the previous packages
+            start = len(resolved)
+            atom, catpkg = Ebuild(
+                arg,
+                force = force,
+                scm = scm,
+                conf = self._config,
+                pkg_manager = self._pkg_manager,
+                tree = self._query.tree(),
+                metadata = metadata,
+                renderer = renderer,
+            ).create(resolved = resolved)
+            records.append({
+                'atom': atom,
+                'catpkg': catpkg,
+                'ebuilds': resolved[start:],
+            })
+        return records
+    
+    
+    def handle(self, request):
+        
+        command = request.get('command', None)
+        args = request.get('args', [])
+        options = request.get('options', {})
+        
+        log.info('Request: %s %s' % (command, ' '.join([str(i) for i in args])))
+        
+        try:
+            with self._lock:
+                query = self.query()
+                if command in self._queries:
+                    records = getattr(query, command)(*args, **options)
+                    if isinstance(records, dict):
+                        records = [records]
+                    records = list(records)
+                elif command == 'generate':
+                    records = self._generate(args, **options)
+                else:
+                    raise DaemonException('Invalid command: %s' % command)
+        except Exception as error:
+            log.error('Request failed: %s' % error)
+            return {
+                'status': 'error',
+                'exception': error.__class__.__name__,
+                'error': str(error),
+            }
+        
+        return {'status': 'ok', 'records': records}
+    
+    
+    def serve_forever(self):
+        
+        # remove the socket of a daemon that died
+        if os.path.exists(self._socket_path):
+            if connect(self._socket_path) is not None:
+                raise DaemonException('Daemon already running: %s' % self._socket_path)
+            os.unlink(self._socket_path)
+        
+        # loading the package database before accept requests
+        self.query()
+        
+        self._server = _Server(self._socket_path, _Handler)
+        self._server.daemon = self
+        os.chmod(self._socket_path, 0o660)
+        
+        log.info('Listening: %s' % self._socket_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            os.unlink(self._socket_path)
+    
+    
+    def shutdown(self):
+        
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class Client(object):
+    
+    def __init__(self, socket_path, conf=None):
+        
+        # the tree is loaded locally only when needed (e.g. to create the
+        # ebuilds with --prefetch)
+        self._query = Query(conf)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._fp = self._socket.makefile('rb')
+    
+    
+    def request(self, command, *args, **options):
+        
+        request = {'command': command, 'args': args, 'options': options}
+        self._socket.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        
+        line = self._fp.readline()
+        if not line:
+            raise DaemonException('Connection closed by the daemon.')
+        response = json.loads(line.decode('utf-8'))
+        
+        if response['status'] != 'ok':
+            # raise the same exception raised by the daemon, if possible
+            error = getattr(exception, response.get('exception', ''), None)
+            if error is None or not issubclass(error, Exception):
+                error = DaemonException
+            raise error(response['error'])
+        
+        return response['records']
+    
+    
+    # methods with the same interface of g_octave.Query
+    
+    def list(self):
+        return self.request('list')
+    
+    def list_raw(self):
+        return self.request('list_raw')
+    
+    def search(self, term):
+        return self.request('search', term)
+    
+    def info(self, pkg, scm=False):
+        return self.request('info', pkg, scm)[0]
+    
+    def rdepends(self, pkgname):
+        return self.request('rdepends', pkgname)
+    
+    def generate(self, packages, force=False, scm=False):
+        return self.request('generate', *packages, force=force, scm=scm)
+    
+    def tree(self):
+        return self._query.tree()
+    
+    
+    def close(self):
+        
+        self._fp.close()
+        self._socket.close()
+
+
+def connect(socket_path, conf=None):
+    """returns a *Client* object connected to the daemon, or None if the
+    daemon isn't running.
+    """
+    
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        return Client(socket_path, conf)
+    except socket.error:
+        return None
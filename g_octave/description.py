@@ -23,21 +23,16 @@ __all__ = [
     're_pkg_atom'
 ]
 
+import io
+import json
 import os
 import re
-import shutil
-import tempfile
-
-from contextlib import closing
+import time
 
 from .config import Config
-from .exception import ConfigException, DescriptionException
-from .compat import py3k, open
-
-if py3k:
-    import urllib.request as urllib
-else:
-    import urllib2 as urllib
+from .download import downloader
+from .exception import ConfigException, DescriptionException, FetchException
+from .compat import open
 
 from .log import Log
 log = Log('g_octave.description')
@@ -62,69 +57,75 @@ class Description(object):
             log.error('File not found: %s' % file)
             raise DescriptionException('File not found: %s' % file)
 
+        with open(file, 'r', encoding="utf-8") as fp:
+            self._parse(fp, parse_sysreq)
+
+
+    def _parse(self, lines, parse_sysreq=True):
+        """parses the lines of a DESCRIPTION file."""
+
         # dictionary with the parsed content of the DESCRIPTION file
         self._desc = dict()
 
         # current key
         key = None
 
-        with open(file, 'r', encoding="utf-8") as fp:
-            for line in fp:
-                line_splited = line.split(':')
+        for line in lines:
+            line_splited = line.split(':')
 
-                # 'key: value' found?
-                if len(line_splited) >= 2:
+            # 'key: value' found?
+            if len(line_splited) >= 2:
 
-                    # by default we have a key before the first ':'
-                    key = line_splited[0].strip().lower()
+                # by default we have a key before the first ':'
+                key = line_splited[0].strip().lower()
 
-                    # all the stuff after the first ':' is the value
-                    # ':' included.
-                    value = ':'.join(line_splited[1:]).strip()
+                # all the stuff after the first ':' is the value
+                # ':' included.
+                value = ':'.join(line_splited[1:]).strip()
 
-                    # the key already exists?
-                    if key in self._desc:
+                # the key already exists?
+                if key in self._desc:
 
-                        # it's one of the dependencies?
-                        if key in ('depends', 'systemrequirements', 'buildrequires'):
+                    # it's one of the dependencies?
+                    if key in ('depends', 'systemrequirements', 'buildrequires'):
 
-                            # use ', ' to separate the values
-                            self._desc[key] += ', '
+                        # use ', ' to separate the values
+                        self._desc[key] += ', '
 
-                        else:
-
-                            # use a single space to separate the values
-                            self._desc[key] += ' '
-
-                    # key didn't exists yet. initializing...
                     else:
-                        self._desc[key] = ''
 
-                    self._desc[key] += value
+                        # use a single space to separate the values
+                        self._desc[key] += ' '
 
-                # it's not a 'key: value', so it's probably a continuation
-                # of the previous line.
+                # key didn't exists yet. initializing...
                 else:
+                    self._desc[key] = ''
 
-                    # empty line
-                    if len(line) == 0:
-                        continue
+                self._desc[key] += value
 
-                    # comments (started with '#')
-                    if line[0] == '#':
-                        continue
+            # it's not a 'key: value', so it's probably a continuation
+            # of the previous line.
+            else:
 
-                    # line continuations starts with a single space
-                    if line[0] != ' ':
-                        continue
+                # empty line
+                if len(line) == 0:
+                    continue
 
-                    # the first line can't be a continuation, obviously :)
-                    if key is None:
-                        continue
+                # comments (started with '#')
+                if line[0] == '#':
+                    continue
+
+                # line continuations starts with a single space
+                if line[0] != ' ':
+                    continue
+
+                # the first line can't be a continuation, obviously :)
+                if key is None:
+                    continue
 
-                    # our line already have a single space at the start.
-                    # we only needs strip spaces at the end of the line
-                    self._desc[key] += line.rstrip()
+                # our line already have a single space at the start.
+                # we only needs strip spaces at the end of the line
+                self._desc[key] += line.rstrip()
 
         # add the 'self_depends' key
         self._desc['self_depends'] = list()
@@ -264,24 +265,153 @@ class Description(object):
         atribute based on the dict with the previously parsed content.
         """
 
+        # the special and private names (e.g. __getnewargs__, looked up by
+        # pickle) aren't fields of the DESCRIPTION file
+        if name.startswith('_'):
+            raise AttributeError(name)
         return self._desc.get(name, None)
 
 
+    def __getstate__(self):
+        """the config object isn't needed after the parsing, so we don't
+        send it over the wire when pickling.
+        """
+
+        state = self.__dict__.copy()
+        state.pop('_config', None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
 class HgDescription(Description):
     
     _url = 'http://sf.net/p/octave'
     
-    def __init__(self, category, package):
-        temp_desc = config_file = tempfile.mkstemp()[1]
-        desc_url = '%s/%s/ci/default/tree/DESCRIPTION?format=raw' % (
-            self._url,
+    # if True, only the DESCRIPTION files from the cache are used
+    offline = False
+    
+    @classmethod
+    def _desc_url(cls, package):
+        return '%s/%s/ci/default/tree/DESCRIPTION?format=raw' % (
+            cls._url,
             package,
         )
-        try:
-            with closing(urllib.urlopen(desc_url)) as fp:
-                with open(temp_desc, 'wb') as fp_:
-                    shutil.copyfileobj(fp, fp_)
-        except:
+    
+    @classmethod
+    def _cache_dir(cls, conf):
+        """returns the directory of the cached DESCRIPTION files, created if
+        needed: 'cache/scm' in the package database, or the user's cache
+        directory if the package database isn't writable (e.g. non-root
+        users).
+        """
+        user_cache = os.environ.get('XDG_CACHE_HOME', None)
+        if user_cache is None:
+            user_cache = os.path.join(os.path.expanduser('~'), '.cache')
+        for cache in [
+            os.path.join(conf.db, 'cache', 'scm'),
+            os.path.join(user_cache, 'g-octave', 'scm'),
+        ]:
+            try:
+                if not os.path.exists(cache):
+                    os.makedirs(cache, 0o755)
+            except OSError:
+                continue
+            if os.access(cache, os.W_OK):
+                return cache
+        raise DescriptionException('No writable directory for the SCM cache')
+    
+    @classmethod
+    def _cache_files(cls, conf, package):
+        """returns the paths of the cached DESCRIPTION file of a package and
+        of its metadata (a JSON file with the HTTP validators).
+        """
+        cache = cls._cache_dir(conf)
+        return (
+            os.path.join(cache, '%s.DESCRIPTION' % package),
+            os.path.join(cache, '%s.json' % package),
+        )
+    
+    @classmethod
+    def prefetch(cls, packages, conf=None):
+        """updates the cached DESCRIPTION files of a list of packages. the
+        files older than the option 'scm_cache_ttl' (in seconds) are
+        revalidated concurrently, using conditional requests.
+        """
+        
+        if cls.offline:
+            return
+        
+        if conf is None:
+            conf = Config()
+        ttl = int(conf.scm_cache_ttl)
+        
+        requests = []
+        cached = []
+        for package in set(packages):
+            desc_file, meta_file = cls._cache_files(conf, package)
+            meta = {}
+            if os.path.exists(desc_file) and os.path.exists(meta_file):
+                try:
+                    with open(meta_file) as fp:
+                        meta = json.load(fp)
+                    if not isinstance(meta, dict):
+                        raise ValueError(meta)
+                except ValueError:
+                    # a cache miss, the DESCRIPTION file is fetched again
+                    log.warning('Invalid file: %s' % meta_file)
+                    meta = {}
+                if time.time() - meta.get('timestamp', 0) < ttl:
+                    continue
+            headers = {}
+            if meta.get('etag') is not None:
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified') is not None:
+                headers['If-Modified-Since'] = meta['last_modified']
+            requests.append({'url': cls._desc_url(package), 'headers': headers})
+            cached.append((package, desc_file, meta_file, meta))
+        
+        if len(requests) == 0:
+            return
+        
+        for (package, desc_file, meta_file, meta), response in \
+          zip(cached, downloader().get_all(requests)):
+            if isinstance(response, FetchException):
+                # the outdated file (if any) is better than nothing
+                log.warning('Failed to revalidate %s: %s' % (package, response))
+                continue
+            if response.status != 304:
+                with io.open(desc_file, 'wb') as fp:
+                    fp.write(response.content)
+                meta = {
+                    'etag': response.headers.get('etag', None),
+                    'last_modified': response.headers.get('last-modified', None),
+                }
+            meta['timestamp'] = time.time()
+            with open(meta_file, 'w') as fp:
+                json.dump(meta, fp)
+    
+    def __init__(self, category, package, conf=None):
+        
+        if conf is None:
+            conf = Config()
+        self._config = conf
+        
+        self.prefetch([package], conf)
+        
+        desc_file = self._cache_files(conf, package)[0]
+        if not os.path.exists(desc_file):
+            if self.offline:
+                raise DescriptionException('DESCRIPTION file not cached: %s' % package)
             raise DescriptionException('Failed to fetch DESCRIPTION file from HG')
-        Description.__init__(self, temp_desc, parse_sysreq=True)
-        os.unlink(temp_desc)
+        
+        with io.open(desc_file, 'rb') as fp:
+            content = fp.read()
+        try:
+            content = content.decode('utf-8')
+        except UnicodeDecodeError:
+            content = content.decode('iso-8859-15')
+        
+        self._parse(content.splitlines(True), parse_sysreq=True)
@@ -14,38 +14,69 @@
 
 from __future__ import absolute_import
 
-__all__ = ['DescriptionTree']
+__all__ = [
+    'DescriptionTree',
+    'version_key',
+]
 
+import multiprocessing
 import os
-import re
-
-from portage.versions import vercmp
 
 from .config import Config
 from .description import *
 from .exception import ConfigException, DescriptionTreeException
+from .index import Index
+from .search import Search
 from .log import Log
 log = Log('g_octave.description_tree')
 
-# from http://wiki.python.org/moin/HowTo/Sorting/
-def cmp_to_key(mycmp):
-    'Convert a cmp= function into a key= function'
-    class K(object):
-        def __init__(self, obj, *args):
-            self.obj = obj
-        def __lt__(self, other):
-            return mycmp(self.obj, other.obj) < 0
-        def __gt__(self, other):
-            return mycmp(self.obj, other.obj) > 0
-        def __eq__(self, other):
-            return mycmp(self.obj, other.obj) == 0
-        def __le__(self, other):
-            return mycmp(self.obj, other.obj) <= 0
-        def __ge__(self, other):
-            return mycmp(self.obj, other.obj) >= 0
-        def __ne__(self, other):
-            return mycmp(self.obj, other.obj) != 0
-    return K
+# cache of the keys returned by version_key
+_version_keys = {}
+
+def version_key(version):
+    """returns a tuple that can be used to sort the versions natively, in
+    the same order of *portage.versions.vercmp*, for the versions allowed
+    on *re_pkg_atom*. the keys are cached per version string.
+    """
+    
+    key = _version_keys.get(version, None)
+    if key is not None:
+        return key
+    
+    components = version.split('.')
+    
+    # the first component is always compared as an integer
+    key = [components[0] != '' and int(components[0]) or -1]
+    
+    for component in components[1:]:
+        if component == '':
+            key.append((-1,))
+        # components with leading zeros are compared as decimal fractions
+        # by portage (e.g. 1.02 < 1.1), after any other component
+        elif component[0] == '0':
+            key.append((0, component.rstrip('0')))
+        else:
+            key.append((1, int(component)))
+    
+    key = tuple(key)
+    _version_keys[version] = key
+    return key
+
+# per-process state of the workers used by DescriptionTree.load_all
+_worker_config = None
+_worker_parse_sysreq = True
+
+def _load_all_init(conf, parse_sysreq):
+    global _worker_config, _worker_parse_sysreq
+    _worker_config = conf
+    _worker_parse_sysreq = parse_sysreq
+
+def _load_all_worker(pkgfile):
+    return Description(
+        pkgfile,
+        conf = _worker_config,
+        parse_sysreq = _worker_parse_sysreq
+    )
 
 class DescriptionTree(object):
     
@@ -54,8 +85,16 @@ class DescriptionTree(object):
         log.info('Parsing the package database.')
         
         self._parse_sysreq = parse_sysreq
+        self._index = None
+        self._search = None
         self.pkg_list = {}
         
+        # package name => list of versions, sorted
+        self._versions = {}
+        
+        # atom => Description object, filled by load_all(cache=True)
+        self._descriptions = {}
+        
         if conf is None:
             conf = Config()
         self._config = conf
@@ -91,6 +130,12 @@ class DescriptionTree(object):
                                 'name': mypkg.group(1),
                                 'version': mypkg.group(2),
                             })
+                            self._versions.setdefault(mypkg.group(1), []).append(
+                                mypkg.group(2)
+                            )
+        
+        for versions in self._versions.values():
+            versions.sort(key=version_key)
     
     
     def __getitem__(self, key):
@@ -102,48 +147,133 @@ class DescriptionTree(object):
         name = mykey.group(1)
         version = mykey.group(2)
         
-        for cat in self.pkg_list:
-            for pkg in self.pkg_list[cat]:
-                if pkg['name'] == name and pkg['version'] == version:
-                    pkgfile = os.path.join(
-                        self._db_path,
-                        cat,
-                        pkg['name'],
-                        '%s-%s.DESCRIPTION' % (pkg['name'], pkg['version']),
-                    )
-                    return Description(
-                        pkgfile,
-                        conf = self._config,
-                        parse_sysreq = self._parse_sysreq
-                    )
-        
-        return None
+        if version not in self._versions.get(name, []):
+            return None
+        
+        if key in self._descriptions:
+            return self._descriptions[key]
+        
+        return Description(
+            self._description_file(name, version),
+            conf = self._config,
+            parse_sysreq = self._parse_sysreq
+        )
     
     
-    def package_versions(self, pkgname):
+    def _description_file(self, name, version):
         
-        tmp = []
+        return os.path.join(
+            self._db_path,
+            self.categories[name],
+            name,
+            '%s-%s.DESCRIPTION' % (name, version),
+        )
+    
+    
+    def load_all(self, workers=None, cache=False):
+        """yields a *g_octave.Description* object for each package of the
+        tree, in the same order of *packages()*. The files are parsed by
+        a pool of *workers* processes (defaults to the number of CPUs),
+        that receives the files in batches. If *cache* is True, the
+        objects are kept in memory and returned by *__getitem__()*.
+        """
         
-        for cat in self.pkg_list:
-            for pkg in self.pkg_list[cat]:
-                if pkg['name'] == pkgname:
-                    tmp.append(pkg['version'])
+        for pkg, desc in zip(self.packages(), self._load_all(workers)):
+            if cache:
+                self._descriptions[pkg] = desc
+            yield desc
+    
+    
+    def _load_all(self, workers):
+        
+        files = []
+        for pkg in self.packages():
+            mypkg = re_pkg_atom.match(pkg)
+            files.append(self._description_file(mypkg.group(1), mypkg.group(2)))
+        
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        workers = min(workers, len(files))
+        
+        if workers <= 1:
+            for pkgfile in files:
+                yield Description(
+                    pkgfile,
+                    conf = self._config,
+                    parse_sysreq = self._parse_sysreq
+                )
+            return
+        
+        # a few batches per worker, to keep all of them busy until the end
+        chunksize = max(1, len(files) // (workers * 4))
+        
+        pool = multiprocessing.Pool(
+            workers,
+            _load_all_init,
+            (self._config, self._parse_sysreq)
+        )
+        try:
+            for desc in pool.imap(_load_all_worker, files, chunksize):
+                desc._config = self._config
+                yield desc
+        finally:
+            pool.terminate()
+            pool.join()
+    
+    
+    def index(self):
+        """returns the *g_octave.Index* object of the tree. if the index
+        from the cache directory is outdated, a new one is built and saved
+        to the cache directory, if possible.
+        """
         
-        tmp.sort(key=cmp_to_key(vercmp))
-        return tmp
+        if self._index is None:
+            index = Index(self._config)
+            if not index.load():
+                index.build(self)
+                try:
+                    index.save()
+                except (IOError, OSError) as error:
+                    # the index is rebuilt the next time
+                    log.info('Failed to save the index: %s' % error)
+            self._index = index
+        return self._index
+    
+    
+    def update_index(self):
+        """rebuilds the index of the tree and saves it to the cache
+        directory. should be called after each sync.
+        """
+        
+        index = Index(self._config)
+        index.build(self)
+        index.save()
+        self._index = index
+        self._search = None
+    
+    
+    def rdepends(self, pkgname):
+        """returns a list with the packages (name-version) that depends
+        on *pkgname*.
+        """
+        
+        return self.index().rdepends.get(pkgname, [])
+    
+    
+    def package_versions(self, pkgname):
+        
+        return list(self._versions.get(pkgname, []))
         
     
     def latest_version(self, pkgname):
         
-        tmp = self.package_versions(pkgname)
-        return (len(tmp) > 0) and tmp[-1] or None
+        versions = self._versions.get(pkgname, [])
+        return (len(versions) > 0) and versions[-1] or None
 
 
     def version_compare(self, versions):
         
-        tmp = list(versions[:])
-        tmp.sort(key=cmp_to_key(vercmp))
-        return (len(tmp) > 0) and tmp[-1] or None
+        return (len(versions) > 0) and max(versions, key=version_key) or None
 
     
     def packages(self):
@@ -159,19 +289,22 @@ class DescriptionTree(object):
 
     
     def search(self, term):
+        """returns a list of tuples (pkgname, versions) with the packages
+        matching the query *term* (see *g_octave.search*), from the best
+        match to the worst.
+        """
         
-        # term can be a regular expression
-        re_term = re.compile(r'%s' % term)
-        packages = {}
+        if self._search is None:
+            self._search = Search(self.index().search)
         
-        for cat in self.pkg_list:
-            for pkg in self.pkg_list[cat]:
-                if re_term.search(pkg['name']) is not None:
-                    if pkg['name'] not in packages:
-                        packages[pkg['name']] = [pkg['version'], '9999']
-                    else:
-                        packages[pkg['name']].insert(-1, pkg['version'])
-                    packages[pkg['name']].sort(key=cmp_to_key(vercmp))
+        packages = []
+        
+        for pkgname in self._search.query(term):
+            # the index may have packages blacklisted on this tree
+            if pkgname in self.categories:
+                packages.append(
+                    (pkgname, self.package_versions(pkgname) + ['9999'])
+                )
         
         return packages
 
@@ -183,9 +316,7 @@ class DescriptionTree(object):
             packages[cat] = {}
             for pkg in self.pkg_list[cat]:
                 if pkg['name'] not in packages[cat]:
-                    packages[cat][pkg['name']] = [pkg['version'], '9999']
-                else:
-                    packages[cat][pkg['name']].insert(-1, pkg['version'])
-                    packages[cat][pkg['name']].sort(key=cmp_to_key(vercmp))
+                    packages[cat][pkg['name']] = \
+                        self.package_versions(pkg['name']) + ['9999']
         
         return packages
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+    distfiles.py
+    ~~~~~~~~~~~~
+
+    This module implements the prefetch of the distfiles of the ebuilds
+    created by g-octave. The files are downloaded concurrently to the
+    DISTDIR and checked against the Manifest files, so the fetch phase of
+    the package manager doesn't need to download anything.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'distfiles',
+    'fetch_distfiles',
+    'read_manifest',
+    'verify',
+]
+
+import hashlib
+import io
+import os
+
+from .download import Downloader
+from .exception import FetchException
+from .compat import open
+
+from .log import Log
+log = Log('g_octave.distfiles')
+
+# the files added to SRC_URI by the g-octave eclass
+_eclass_uri = 'http://hg.code.sf.net/p/octave/packages'
+_eclass_distfiles = [
+    ('g-octave_Makefile', _eclass_uri + '/package_Makefile.in'),
+    ('g-octave_configure', _eclass_uri + '/package_configure.in'),
+]
+
+_default_mirrors = ['http://downloads.sourceforge.net']
+
+# Manifest hashes => hashlib algorithms
+_hashes = {
+    'MD5': 'md5',
+    'SHA1': 'sha1',
+    'SHA256': 'sha256',
+    'SHA512': 'sha512',
+    'RMD160': 'ripemd160',
+    'BLAKE2B': 'blake2b',
+}
+
+
+def _sourceforge_mirrors():
+    try:
+        import portage
+        mirrors = portage.settings.thirdpartymirrors().get('sourceforge')
+    except Exception:
+        mirrors = None
+    return mirrors or _default_mirrors
+
+
+def distfiles(ebuild_file, mirrors=None):
+    """returns a list of tuples (filename, urls) with the distfiles
+    of a g-octave ebuild.
+    """
+
+    if mirrors is None:
+        mirrors = _sourceforge_mirrors()
+
+    p = os.path.basename(ebuild_file)[:-len('.ebuild')]
+
+    files = []
+    if not p.endswith('-9999'):
+        filename = '%s.tar.gz' % p
+        files.append((
+            filename,
+            ['%s/octave/%s' % (i.rstrip('/'), filename) for i in mirrors],
+        ))
+    for filename, url in _eclass_distfiles:
+        files.append((filename, [url]))
+    return files
+
+
+def read_manifest(manifest_file):
+    """returns a dict with the DIST entries of a Manifest file, as tuples
+    (size, {hash: digest}).
+    """
+
+    entries = {}
+    if not os.path.exists(manifest_file):
+        return entries
+    with open(manifest_file) as fp:
+        for line in fp:
+            fields = line.split()
+            if len(fields) < 3 or fields[0] != 'DIST':
+                continue
+            entries[fields[1]] = (
+                int(fields[2]),
+                dict(zip(fields[3::2], fields[4::2])),
+            )
+    return entries
+
+
+def verify(filename, entry):
+    """checks a file against a Manifest entry. the hashes not supported
+    by hashlib are ignored.
+    """
+
+    size, digests = entry
+    if os.path.getsize(filename) != size:
+        return False
+
+    hashes = {}
+    for name, digest in digests.items():
+        try:
+            hashes[name] = (hashlib.new(_hashes[name]), digest)
+        except (KeyError, ValueError):
+            log.info('Unsupported hash: %s' % name)
+
+    with io.open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(65536), b''):
+            for my_hash, digest in hashes.values():
+                my_hash.update(block)
+
+    for name, (my_hash, digest) in hashes.items():
+        if my_hash.hexdigest() != digest.lower():
+            log.error('%s mismatch: %s' % (name, filename))
+            return False
+    return True
+
+
+def fetch_distfiles(ebuild_files, distdir, jobs=4, mirrors=None):
+    """downloads the missing distfiles of a list of ebuilds to *distdir*,
+    using up to *jobs* concurrent connections. the files are verified
+    against the Manifest files, when available. returns a list with the
+    names of the files that couldn't be fetched.
+    """
+
+    # filename => [urls, Manifest entry]
+    wanted = {}
+    for ebuild_file in ebuild_files:
+        entries = read_manifest(
+            os.path.join(os.path.dirname(ebuild_file), 'Manifest')
+        )
+        for filename, urls in distfiles(ebuild_file, mirrors):
+            if filename not in wanted:
+                wanted[filename] = [urls, None]
+            if filename in entries:
+                wanted[filename][1] = entries[filename]
+
+    pending = []
+    for filename in sorted(wanted):
+        dest = os.path.join(distdir, filename)
+        entry = wanted[filename][1]
+        if os.path.exists(dest) and (entry is None or verify(dest, entry)):
+            log.info('Distfile already fetched: %s' % filename)
+            continue
+        pending.append(filename)
+
+    if len(pending) > 0 and not os.path.exists(distdir):
+        os.makedirs(distdir, 0o755)
+
+    downloader = Downloader(max_connections=jobs)
+
+    # each round tries the next mirror of the files that failed
+    mirror = 0
+    while len(pending) > 0:
+        requests = []
+        for filename in pending:
+            urls = wanted[filename][0]
+            if mirror < len(urls):
+                requests.append((filename, {
+                    'url': urls[mirror],
+                    'dest': os.path.join(distdir, filename),
+                }))
+        if len(requests) == 0:
+            break
+
+        responses = downloader.get_all([i[1] for i in requests])
+        for (filename, request), response in zip(requests, responses):
+            if isinstance(response, FetchException):
+                log.warning(str(response))
+                continue
+            entry = wanted[filename][1]
+            if entry is not None and not verify(request['dest'], entry):
+                log.warning('Digest verification failed: %s' % filename)
+                os.unlink(request['dest'])
+                continue
+            pending.remove(filename)
+        mirror += 1
+
+    return pending
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+"""
+    download.py
+    ~~~~~~~~~~~
+    
+    This module implements the download engine used by g-octave to fetch
+    the package database, the DESCRIPTION files of the live packages and
+    the distfiles.
+    
+    The HTTP connections are kept alive and reused for each host, and the
+    concurrent downloads are scheduled by an asyncio event loop. The
+    requests aren't non-blocking: httplib has no asynchronous API, so each
+    blocking request runs on a pool of threads (run_in_executor), that
+    also limits the number of connections. Without asyncio (Python 2) the
+    downloads are done sequentially.
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'Downloader',
+    'Response',
+    'downloader',
+]
+
+import os
+import shutil
+import threading
+
+from .compat import py3k
+from .exception import FetchException
+
+if py3k:
+    import http.client as httplib
+    from urllib.parse import urljoin, urlsplit
+    from urllib.request import getproxies, proxy_bypass
+else:
+    import httplib
+    from urlparse import urljoin, urlsplit
+    from urllib import getproxies, proxy_bypass
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+from .log import Log
+log = Log('g_octave.download')
+
+
+class Response(object):
+    
+    def __init__(self, url, status, headers, content=None, filename=None):
+        
+        self.url = url
+        self.status = status
+        # header names in lowercase
+        self.headers = headers
+        self.content = content
+        self.filename = filename
+
+
+class Downloader(object):
+    
+    _user_agent = 'g-octave'
+    _redirects = (301, 302, 303, 307, 308)
+    _max_redirects = 5
+    
+    def __init__(self, max_connections=4, timeout=60):
+        
+        self.max_connections = max_connections
+        self.timeout = timeout
+        
+        # (scheme, host) => list of idle connections
+        self._pool = {}
+        self._lock = threading.Lock()
+        self._proxies = getproxies()
+    
+    
+    def _connection(self, scheme, netloc):
+        
+        with self._lock:
+            idle = self._pool.get((scheme, netloc), [])
+            if len(idle) > 0:
+                return idle.pop()
+        
+        host = netloc.split('@')[-1]
+        proxy = self._proxies.get(scheme, None)
+        if proxy is not None and not proxy_bypass(host.split(':')[0]):
+            proxy = urlsplit(proxy).netloc
+        else:
+            proxy = None
+        
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(proxy or host, timeout=self.timeout)
+            if proxy is not None:
+                conn.set_tunnel(host)
+        elif scheme == 'http':
+            conn = httplib.HTTPConnection(proxy or host, timeout=self.timeout)
+            # plain http proxies receive the full url in the request
+            conn._g_octave_proxy = proxy is not None
+        else:
+            raise FetchException('Unsupported URL scheme: %s' % scheme)
+        return conn
+    
+    
+    def _release(self, scheme, netloc, conn):
+        
+        with self._lock:
+            self._pool.setdefault((scheme, netloc), []).append(conn)
+    
+    
+    def close(self):
+        
+        with self._lock:
+            for idle in self._pool.values():
+                for conn in idle:
+                    conn.close()
+            self._pool = {}
+    
+    
+    def _request(self, url, dest=None, headers=None):
+        
+        url_ = urlsplit(url)
+        path = url_.path or '/'
+        if url_.query:
+            path += '?' + url_.query
+        
+        conn = self._connection(url_.scheme, url_.netloc)
+        if getattr(conn, '_g_octave_proxy', False):
+            path = url
+        
+        my_headers = {'User-Agent': self._user_agent}
+        my_headers.update(headers or {})
+        
+        try:
+            try:
+                conn.request('GET', path, headers=my_headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, IOError):
+                # the server may have closed an idle connection. retrying
+                # with a new one
+                conn.close()
+                conn.request('GET', path, headers=my_headers)
+                response = conn.getresponse()
+            
+            my_response = Response(
+                url,
+                response.status,
+                dict([(k.lower(), v) for k, v in response.getheaders()]),
+            )
+            
+            if response.status == 200 and dest is not None:
+                temp = dest + '.part'
+                try:
+                    with open(temp, 'wb') as fp:
+                        shutil.copyfileobj(response, fp)
+                    os.rename(temp, dest)
+                except:
+                    # the partial download is useless
+                    if os.path.exists(temp):
+                        os.unlink(temp)
+                    raise
+                my_response.filename = dest
+            else:
+                my_response.content = response.read()
+        except (httplib.HTTPException, IOError) as error:
+            conn.close()
+            raise FetchException('Failed to fetch %s: %s' % (url, error))
+        
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(url_.scheme, url_.netloc, conn)
+        
+        return my_response
+    
+    
+    def get(self, url, dest=None, headers=None):
+        """downloads an URL, following the redirects. if *dest* is given,
+        the content is saved to this file instead of being kept in memory.
+        returns a *Response* object, or raises *FetchException* for
+        errors.
+        """
+        
+        log.info('Fetching: %s' % url)
+        
+        for i in range(self._max_redirects + 1):
+            response = self._request(url, dest, headers)
+            if response.status not in self._redirects:
+                break
+            url = urljoin(url, response.headers['location'])
+        
+        if response.status >= 400 or response.status in self._redirects:
+            raise FetchException('Failed to fetch %s: HTTP error %i' % (url, response.status))
+        
+        return response
+    
+    
+    def _get(self, request):
+        
+        if isinstance(request, dict):
+            return self.get(**request)
+        return self.get(request)
+    
+    
+    def get_all(self, requests):
+        """downloads a list of requests concurrently. the requests are URLs
+        or dicts with the arguments of *get()*. returns a list with the
+        *Response* objects, or the *FetchException* objects for the failed
+        requests, in the same order of the requests.
+        
+        the blocking requests are run by the event loop on a pool of
+        *max_connections* threads.
+        """
+        
+        requests = list(requests)
+        
+        def get(request):
+            try:
+                return self._get(request)
+            except FetchException as error:
+                return error
+        
+        if asyncio is None or len(requests) <= 1:
+            return [get(i) for i in requests]
+        
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(self.max_connections)
+        try:
+            futures = [loop.run_in_executor(executor, get, i) for i in requests]
+            return loop.run_until_complete(asyncio.gather(*futures))
+        finally:
+            executor.shutdown()
+            loop.close()
+
+
+# instance shared by all the modules
+_downloader = None
+
+def downloader():
+    
+    global _downloader
+    if _downloader is None:
+        _downloader = Downloader()
+    return _downloader
@@ -15,22 +15,35 @@ from __future__ import absolute_import
 
 __all__ = [
     'Ebuild',
+    'Renderer',
+    'generate_all',
     're_keywords',
+    'source_digest',
 ]
 
 from .config import Config
 from .description import *
 from .description_tree import *
 from .exception import EbuildException
+from .index import Index, index_patches
+from .metadata import MetadataCache
 from .compat import open
 
+from .log import Log
+log = Log('g_octave.ebuild')
+
+import fcntl
 import getpass
+import hashlib
+import io
+import multiprocessing
 import os
 import portage
 import re
 import shutil
 import subprocess
 
+from multiprocessing.pool import ThreadPool
 from portage.versions import vercmp
 
 out = portage.output.EOutput()
@@ -38,9 +51,200 @@ out = portage.output.EOutput()
 # validating keywords (based on the keywords from the sci-mathematics/octave package)
 re_keywords = re.compile(r'(~)?(alpha|amd64|hppa|ppc64|ppc|sparc|x86)')
 
+# ioctl to clone a file on copy-on-write filesystems (Linux)
+_FICLONE = 0x40049409
+
+
+def _digest(filename):
+    
+    my_hash = hashlib.sha1()
+    with io.open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(65536), b''):
+            my_hash.update(block)
+    return my_hash.digest()
+
+
+def _install_file(src, dest):
+    """puts a copy of *src* on *dest*, if the content of the files differs.
+    a hardlink is used if possible, then a reflink, then a real copy.
+    """
+    
+    if os.path.exists(dest):
+        if os.path.samefile(src, dest):
+            return
+        if os.path.getsize(src) == os.path.getsize(dest) and \
+          _digest(src) == _digest(dest):
+            return
+        os.unlink(dest)
+    
+    try:
+        os.link(src, dest)
+        return
+    except OSError:
+        pass
+    
+    try:
+        with io.open(src, 'rb') as fp_src:
+            with io.open(dest, 'wb') as fp_dest:
+                fcntl.ioctl(fp_dest.fileno(), _FICLONE, fp_src.fileno())
+        shutil.copystat(src, dest)
+        return
+    except (IOError, OSError):
+        if os.path.exists(dest):
+            os.unlink(dest)
+    
+    shutil.copy2(src, dest)
+
+_ebuild_template = """\
+# Copyright 1999-2010 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+# This ebuild was generated by g-octave
+
+EAPI="3"
+
+G_OCTAVE_CAT="%(category)s"
+
+inherit g-octave%(eutils)s
+
+DESCRIPTION="%(description)s"
+HOMEPAGE="%(url)s"
+
+LICENSE="%(license)s"
+SLOT="0"
+KEYWORDS="%(keywords)s"
+IUSE=""
+
+DEPEND="%(depend)s"
+RDEPEND="${DEPEND}
+\t%(rdepend)s"
+%(src_prepare)s"""
+
+_src_prepare_template = """
+src_prepare() {%s
+\tg-octave_src_prepare
+}
+"""
+
+_metadata_template = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE pkgmetadata SYSTEM "http://www.gentoo.org/dtd/metadata.dtd">
+<pkgmetadata>
+\t<herd>no-herd</herd>
+\t<maintainer>
+\t\t<email>%(username)s@%(hostname)s</email>
+\t</maintainer>
+\t<longdescription lang="en">
+\t\tThe files on this directory was created by g-octave.
+\t</longdescription>
+</pkgmetadata>
+"""
+
+
+class Renderer(object):
+    """keeps the values that are the same for all the ebuilds created on a
+    session: the keywords, the index of the patches and the metadata.xml
+    file. *index* is the *g_octave.Index* object of the tree, if available.
+    """
+    
+    def __init__(self, conf=None, index=None):
+        
+        if conf is None:
+            conf = Config()
+        self._config = conf
+        self._index = index
+        
+        # ACCEPT_KEYWORDS => KEYWORDS
+        self._keywords = {}
+        self._patches = None
+        self._metadata_xml = None
+    
+    
+    def keywords(self, accept_keywords=None):
+        
+        if accept_keywords is None:
+            accept_keywords = portage.settings['ACCEPT_KEYWORDS']
+        
+        if accept_keywords in self._keywords:
+            return self._keywords[accept_keywords]
+        
+        keywords = [i.strip() for i in accept_keywords.split(' ')]
+        
+        stable = []
+        unstable = []
+        
+        for keyword in keywords:
+            match = re_keywords.match(keyword)
+            if match == None:
+                raise EbuildException('Invalid keyword: %s' % keyword)
+            if match.group(1) == None:
+                stable.append(match.group(2))
+            else:
+                unstable.append(match.group(2))
+        
+        final = ['~'+i for i in unstable]
+        
+        for keyword in stable:
+            if keyword not in unstable:
+                final.append(keyword)
+        
+        self._keywords[accept_keywords] = ' '.join(final)
+        return self._keywords[accept_keywords]
+    
+    
+    def patches(self, pkgname, version):
+        
+        if self._patches is None and self._index is not None:
+            self._patches = self._index.patches
+        
+        if self._patches is None:
+            # the patches are indexed at sync time
+            index = Index(self._config)
+            if index.load():
+                self._patches = index.patches
+            else:
+                self._patches = index_patches(
+                    os.path.join(self._config.db, 'patches')
+                )
+        
+        return self._patches.get('%s-%s' % (pkgname, version), [])
+    
+    
+    def metadata_xml(self):
+        
+        if self._metadata_xml is None:
+            try:
+                hostname = os.uname()[1]
+            except:
+                hostname = 'localhost'
+            self._metadata_xml = _metadata_template % {
+                'username': getpass.getuser(),
+                'hostname': hostname,
+            }
+        
+        return self._metadata_xml
+
+
+def source_digest(conf, tree, renderer, pkgname, version):
+    """returns a digest of the files used to create the ebuild of a
+    package: the DESCRIPTION file and the patches.
+    """
+    
+    files = [tree._description_file(pkgname, version)]
+    files += [
+        os.path.join(conf.db, 'patches', i)
+        for i in renderer.patches(pkgname, version)
+    ]
+    my_hash = hashlib.sha1()
+    for filename in files:
+        my_hash.update(os.path.basename(filename).encode('utf-8'))
+        with io.open(filename, 'rb') as fp:
+            my_hash.update(fp.read())
+    return my_hash.hexdigest()
+
+
 class Ebuild:
     
-    def __init__(self, pkg_atom, force=False, scm=False, conf=None, pkg_manager=None):
+    def __init__(self, pkg_atom, force=False, scm=False, conf=None, pkg_manager=None, tree=None, metadata=None, renderer=None):
         
         self.__scm = scm
         self.__force = force
@@ -52,7 +256,22 @@ class Ebuild:
         
         self._config = conf
         
-        self.__dbtree = DescriptionTree(conf = self._config)
+        # the tree can be shared by all the ebuilds created on a session
+        if tree is None:
+            tree = DescriptionTree(conf = self._config)
+        self.__dbtree = tree
+        
+        # the same for the metadata cache of the overlay
+        if metadata is None:
+            metadata = MetadataCache(conf = self._config)
+        self.__metadata = metadata
+        
+        if renderer is None:
+            renderer = Renderer(
+                conf = self._config,
+                index = self.__dbtree.index(),
+            )
+        self.__renderer = renderer
         
         atom = re_pkg_atom.match(pkg_atom)
         if atom == None:
@@ -66,7 +285,7 @@ class Ebuild:
             self.version = '9999'
             category = self.__dbtree.categories.get(self.pkgname, None)
             if category is not None:
-                self.__desc = HgDescription(category, self.pkgname)
+                self.__desc = HgDescription(category, self.pkgname, self._config)
             else:
                 raise EbuildException('Failed to find the octave-forge category of this package.')
         else:
@@ -81,7 +300,7 @@ class Ebuild:
         return self.__desc
 
 
-    def create(self, display_info=True, accept_keywords=None, manifest=True, nodeps=False):
+    def create(self, display_info=True, accept_keywords=None, manifest=True, nodeps=False, resolved=None):
         
         my_ebuild = os.path.join(
             self._config.overlay,
@@ -90,27 +309,35 @@ class Ebuild:
             '%s-%s.ebuild' % (self.pkgname, self.version)
         )
         
+        my_atom = (
+            '=g-octave/%s-%s' % (self.pkgname, self.version),
+            'g-octave/%s' % self.pkgname,
+        )
+        
+        # the list 'resolved' collects the ebuild files of the package
+        # and of all the dependencies, even if they already exist. a
+        # package already resolved isn't visited again.
+        if resolved is None:
+            resolved = []
+        if my_ebuild in resolved:
+            return my_atom
+        resolved.append(my_ebuild)
+        
         if not os.path.exists(my_ebuild) or self.__force:
             
             if display_info:
                 out.einfo('Creating ebuild: g-octave/%s-%s.ebuild' % (self.pkgname, self.version))
             
             try:
-                my_atom, my_catpkg = self.__create(accept_keywords, manifest)
+                my_atom = self.__create(accept_keywords, manifest)
             except Exception as error:
                 if display_info:
                     out.eerror('Failed to create: g-octave/%s-%s.ebuild' % (self.pkgname, self.version))
                 raise EbuildException(error)
-            else:
-                if not nodeps:
-                    self.__resolve_dependencies()
-                return my_atom, my_catpkg
         
-        else:
-            return (
-                '=g-octave/%s-%s' % (self.pkgname, self.version),
-                'g-octave/%s' % self.pkgname,
-            )
+        if not nodeps:
+            self.__resolve_dependencies(manifest, resolved)
+        return my_atom
 
 
     def __create(self, accept_keywords=None, manifest=True):
@@ -122,50 +349,9 @@ class Ebuild:
         if not os.path.exists(ebuild_path):
             os.makedirs(ebuild_path, 0o755)
         
-        ebuild = """\
-# Copyright 1999-2010 Gentoo Foundation
-# Distributed under the terms of the GNU General Public License v2
-# This ebuild was generated by g-octave
-
-EAPI="3"
-
-G_OCTAVE_CAT="%(category)s"
-
-inherit g-octave%(eutils)s
-
-DESCRIPTION="%(description)s"
-HOMEPAGE="%(url)s"
-
-LICENSE="%(license)s"
-SLOT="0"
-KEYWORDS="%(keywords)s"
-IUSE=""
-
-DEPEND="%(depend)s"
-RDEPEND="${DEPEND}
-\t%(rdepend)s"
-"""
-        
-        metadata = """\
-<?xml version="1.0" encoding="UTF-8"?>
-<!DOCTYPE pkgmetadata SYSTEM "http://www.gentoo.org/dtd/metadata.dtd">
-<pkgmetadata>
-\t<herd>no-herd</herd>
-\t<maintainer>
-\t\t<email>%(username)s@%(hostname)s</email>
-\t</maintainer>
-\t<longdescription lang="en">
-\t\tThe files on this directory was created by g-octave.
-\t</longdescription>
-</pkgmetadata>
-"""
-        
         description = len(self.__desc.description) > 70 and \
             self.__desc.description[:70]+'...' or self.__desc.description
         
-        if accept_keywords is None:
-            accept_keywords = portage.settings['ACCEPT_KEYWORDS']
-        
         category = self.__dbtree.categories.get(self.pkgname, '')
         
         vars = {
@@ -173,10 +359,12 @@ RDEPEND="${DEPEND}
             'description': description,
             'url': self.__desc.url,
             'license': self.__desc.license_gentoo,
-            'keywords': self.__keywords(accept_keywords),
+            'keywords': self.__scm and '' or \
+                self.__renderer.keywords(accept_keywords),
             'category': category,
             'depend': '',
             'rdepend': '',
+            'src_prepare': '',
         }
         
         vars['depend']   = self.__depends(self.__desc.buildrequires)
@@ -187,7 +375,7 @@ RDEPEND="${DEPEND}
         
         vars['rdepend']  = self.__depends(self.__desc.depends)
         
-        patches = self.__search_patches()
+        patches = self.__renderer.patches(self.pkgname, self.version)
         
         if len(patches) > 0:
             
@@ -201,24 +389,40 @@ RDEPEND="${DEPEND}
             patch_string = ''
             for patch in patches:
                 patch_string += "\n\tepatch \"${FILESDIR}/%s\"" % patch
-                shutil.copy2(os.path.join(patchesdir, patch), filesdir)
+                _install_file(
+                    os.path.join(patchesdir, patch),
+                    os.path.join(filesdir, patch)
+                )
             
-            ebuild += "\nsrc_prepare() {%s\n\tg-octave_src_prepare\n}\n" % patch_string
+            vars['src_prepare'] = _src_prepare_template % patch_string
             vars['eutils'] = ' eutils'
             
         with open(ebuild_file, 'w') as fp:
-            fp.write(ebuild % vars)
+            fp.write(_ebuild_template % vars)
+        
+        self.__metadata.update(self.pkgname, self.version, ebuild_file, {
+            'EAPI': '3',
+            'DESCRIPTION': description,
+            'HOMEPAGE': self.__desc.url,
+            'LICENSE': vars['license'],
+            'SLOT': '0',
+            'KEYWORDS': vars['keywords'],
+            'DEPEND': vars['depend'],
+            'RDEPEND': vars['depend'] + ' ' + vars['rdepend'],
+        }, patched = len(patches) > 0)
+        
+        # the live ebuilds don't depend on the package database
+        if not self.__scm:
+            self.__metadata.set_stamp(
+                self.pkgname, self.version, source_digest(
+                    self._config, self.__dbtree, self.__renderer,
+                    self.pkgname, self.version
+                )
+            )
         
         if not os.path.exists(metadata_file):
-            try:
-                hostname = os.uname()[1]
-            except:
-                hostname = 'localhost'
             with open(metadata_file, 'w') as fp:
-                fp.write(metadata % {
-                    'username': getpass.getuser(),
-                    'hostname': hostname,
-                })
+                fp.write(self.__renderer.metadata_xml())
         
         if manifest:
             proc = self.__pkg_manager.create_manifest(ebuild_file)
@@ -230,34 +434,6 @@ RDEPEND="${DEPEND}
             '=g-octave/%s-%s' % (self.pkgname, self.version),
             'g-octave/%s' % self.pkgname,
         )
-        
-    
-    def __keywords(self, accept_keywords):
-        
-        if self.__scm:
-            return ''
-        
-        keywords = [i.strip() for i in accept_keywords.split(' ')]
-        
-        stable = []
-        unstable = []
-        
-        for keyword in keywords:
-            match = re_keywords.match(keyword)
-            if match == None:
-                raise EbuildException('Invalid keyword: %s' % keyword)
-            if match.group(1) == None:
-                stable.append(match.group(2))
-            else:
-                unstable.append(match.group(2))
-        
-        final = ['~'+i for i in unstable]
-        
-        for keyword in stable:
-            if keyword not in unstable:
-                final.append(keyword)
-        
-        return ' '.join(final)
     
     
     def __depends(self, mylist):
@@ -268,25 +444,15 @@ RDEPEND="${DEPEND}
         return ''
 
 
-    def __search_patches(self):
+    def __resolve_dependencies(self, manifest=True, resolved=None):
         
-        patches_dir = os.path.join(self._config.db, 'patches')
-        
-        if not os.path.exists(patches_dir):
-            return []
-        
-        tmp = []
-        
-        for patch in os.listdir(patches_dir):
-            if re.match(r'^([0-9]{3})_%s-%s' % (self.pkgname, self.version), patch):
-                tmp.append(patch)
-        
-        tmp.sort()
-        
-        return tmp
-
-
-    def __resolve_dependencies(self):
+        # the DESCRIPTION files of the live dependencies are downloaded
+        # concurrently
+        if self.__scm:
+            HgDescription.prefetch(
+                [i[0] for i in self.__desc.self_depends],
+                self._config
+            )
         
         to_install = []
         
@@ -319,5 +485,97 @@ RDEPEND="${DEPEND}
                 force = self.__force,
                 conf = self.__conf,
                 pkg_manager = self.__pkg_manager,
-                scm = self.__scm
-            ).create()
+                scm = self.__scm,
+                tree = self.__dbtree,
+                metadata = self.__metadata,
+                renderer = self.__renderer
+            ).create(manifest=manifest, resolved=resolved)
+
+
+def generate_all(conf=None, pkg_manager=None, jobs=None, force=False,
+                 accept_keywords=None, prefetch=False, display_info=True):
+    """creates the ebuilds of all the packages of the tree in a single
+    pass. The DESCRIPTION files are parsed by *jobs* processes (defaults
+    to the number of CPUs), and the ebuilds are created as soon as they
+    are parsed, sharing the tree, the metadata cache and the renderer.
+    The Manifest files are created at the end, once per package, by *jobs*
+    threads, after downloading the distfiles concurrently if *prefetch*
+    is True. returns a list with the atoms that failed.
+    """
+    
+    if conf is None:
+        conf = Config()
+    
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    
+    tree = DescriptionTree(conf = conf)
+    metadata = MetadataCache(conf = conf)
+    renderer = Renderer(conf = conf, index = tree.index())
+    
+    failed = []
+    resolved = []
+    
+    # the DESCRIPTION files are parsed in parallel, and cached by the tree
+    for atom, desc in zip(tree.packages(), tree.load_all(jobs, cache=True)):
+        try:
+            Ebuild(
+                atom,
+                force = force,
+                conf = conf,
+                pkg_manager = pkg_manager,
+                tree = tree,
+                metadata = metadata,
+                renderer = renderer,
+            ).create(
+                display_info = display_info,
+                accept_keywords = accept_keywords,
+                manifest = False,
+                nodeps = True,
+                resolved = resolved,
+            )
+        except EbuildException as error:
+            log.error('Failed to create the ebuild: %s (%s)' % (atom, error))
+            failed.append(atom)
+    
+    if pkg_manager is None:
+        return failed
+    
+    # the Manifest file of a package covers all the ebuilds of the
+    # directory. it's only created again if some ebuild is newer
+    ebuilds = {}
+    for ebuild_file in [i for i in resolved if os.path.exists(i)]:
+        ebuilds.setdefault(os.path.dirname(ebuild_file), []).append(ebuild_file)
+    for pkgdir in list(ebuilds):
+        manifest_file = os.path.join(pkgdir, 'Manifest')
+        if os.path.exists(manifest_file):
+            mtime = os.path.getmtime(manifest_file)
+            if all([os.path.getmtime(i) <= mtime for i in ebuilds[pkgdir]]):
+                del ebuilds[pkgdir]
+    
+    if prefetch:
+        from .distfiles import fetch_distfiles
+        fetch_distfiles(
+            [i for pkgdir in ebuilds for i in ebuilds[pkgdir]],
+            portage.settings['DISTDIR'],
+            jobs
+        )
+    
+    def manifest(pkgdir):
+        return pkg_manager.create_manifest(ebuilds[pkgdir][0])
+    
+    pool = ThreadPool(jobs)
+    try:
+        dirs = sorted(ebuilds)
+        for pkgdir, ret in zip(dirs, pool.imap(manifest, dirs)):
+            if ret != os.EX_OK:
+                log.error('Failed to create Manifest file: %s' % pkgdir)
+                failed.extend([
+                    os.path.basename(i)[:-len('.ebuild')]
+                    for i in ebuilds[pkgdir]
+                ])
+    finally:
+        pool.close()
+        pool.join()
+    
+    return failed
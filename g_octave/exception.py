@@ -13,16 +13,21 @@
 
 __all__ = [
     'ConfigException',
+    'DaemonException',
     'DescriptionException',
     'DescriptionTreeException',
     'EbuildException',
     'FetchException',
+    'SearchException',
 ]
 
 
 class ConfigException(Exception):
     pass
 
+class DaemonException(Exception):
+    pass
+
 class DescriptionException(Exception):
     pass
 
@@ -34,3 +39,6 @@ class EbuildException(Exception):
 
 class FetchException(Exception):
     pass
+
+class SearchException(Exception):
+    pass
@@ -20,21 +20,15 @@ __all__ = ['fetch']
 from .config import Config
 conf = Config(True) # fetch phase
 
+from .download import downloader
 from .exception import FetchException
-from .compat import py3k, open as open_
+from .compat import open as open_
 
-if py3k:
-    import urllib.request as urllib
-else:
-    import urllib2 as urllib
-
-import codecs
 import glob
 import json
 import os
 import re
 import shutil
-import subprocess
 import sys
 import tarfile
 
@@ -70,11 +64,8 @@ class GitHub:
             self.repo,
             branch
         )
-        commits = {}
-        with closing(urllib.urlopen(url)) as fp:
-            reader = codecs.getreader('utf-8')
-            commits = json.load(reader(fp))
-        return commits
+        response = downloader().get(url)
+        return json.loads(response.content.decode('utf-8'))
     
     def fetch_db(self, branch='master'):
         cache = os.path.join(conf.db, 'cache')
@@ -87,20 +78,17 @@ class GitHub:
                 if fp.read().strip() == last_commit:
                     return False
         dest = os.path.join(cache, 'octave-forge-%s.tar.gz' % last_commit)
-        return_value = subprocess.call([
-            'wget',
-            '--continue',
-            '--output-document', dest,
+        downloader().get(
             '%s/%s/%s/tarball/%s/' % (
                 self.url,
                 self.user,
                 self.repo,
                 branch
-            )
-        ])
-        if return_value == os.EX_OK:
-            with open_(os.path.join(cache, 'commit_id'), 'w') as fp:
-                fp.write(last_commit)
+            ),
+            dest = dest
+        )
+        with open_(os.path.join(cache, 'commit_id'), 'w') as fp:
+            fp.write(last_commit)
         return True
 
     def extract(self):
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+    index.py
+    ~~~~~~~~
+    
+    This module implements a Python object with data precomputed from the
+    package database (e.g. the reverse dependencies of the packages and
+    the patches available for each package). The
+    index is built at sync time and saved to the db cache directory, being
+    valid only for the commit id of the package database that was used to
+    build it.
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'Index',
+    'index_patches',
+    're_patch',
+]
+
+import json
+import os
+import re
+
+from .compat import atomic_open, open
+from .description import re_pkg_atom
+from .search import build_search_index
+from .log import Log
+log = Log('g_octave.index')
+
+# patches for the packages, like '001_control-1.0.11.patch' or
+# '002_control-1.0.11-gcc45.patch'
+re_patch = re.compile(r'^([0-9]{3})_(.+)-([0-9]+(?:\.[0-9]+)*)(?:\.?[^0-9.].*)?$')
+
+
+def index_patches(patches_dir):
+    """returns a dict with the patches available on *patches_dir* for each
+    package atom (e.g. 'control-1.0.11'), in the order that they should be
+    applied.
+    """
+    
+    patches = {}
+    
+    if not os.path.isdir(patches_dir):
+        return patches
+    
+    for patch in sorted(os.listdir(patches_dir)):
+        match = re_patch.match(patch)
+        if match is None:
+            log.warning('Invalid patch name: %s' % patch)
+            continue
+        atom = '%s-%s' % (match.group(2), match.group(3))
+        patches.setdefault(atom, []).append(patch)
+    
+    return patches
+
+
+class Index(object):
+    
+    # increase this every time that the structure of the index changes
+    _version = 3
+    
+    def __init__(self, conf):
+        
+        self._config = conf
+        self._cache = os.path.join(conf.db, 'cache')
+        self._file = os.path.join(self._cache, 'index.json')
+        self._index = {}
+    
+    
+    def commit_id(self):
+        
+        commit_id = os.path.join(self._cache, 'commit_id')
+        if not os.path.exists(commit_id):
+            return None
+        with open(commit_id) as fp:
+            return fp.read().strip()
+    
+    
+    def mtime(self):
+        
+        if not os.path.exists(self._file):
+            return None
+        return os.stat(self._file).st_mtime
+    
+    
+    def load(self):
+        """loads the index from the cache directory. returns False if the
+        index isn't available or if it is outdated.
+        """
+        
+        commit_id = self.commit_id()
+        if commit_id is None or not os.path.exists(self._file):
+            return False
+        
+        try:
+            with open(self._file) as fp:
+                index = json.load(fp)
+        except ValueError:
+            log.warning('Invalid index file: %s' % self._file)
+            return False
+        
+        if index.get('version') != self._version or \
+          index.get('commit_id') != commit_id:
+            log.info('Outdated index file: %s' % self._file)
+            return False
+        
+        log.info('Index loaded: %s' % self._file)
+        self._index = index
+        return True
+    
+    
+    def build(self, tree):
+        """builds the index in memory, from a *g_octave.DescriptionTree*
+        object.
+        """
+        
+        log.info('Building the index of the package database.')
+        
+        rdepends = {}
+        search = []
+        
+        packages = tree.packages()
+        for pkg, desc in zip(packages, tree.load_all()):
+            for name, comp, version in desc.self_depends:
+                if name not in rdepends:
+                    rdepends[name] = []
+                rdepends[name].append(pkg)
+            search.append((re_pkg_atom.match(pkg).group(1), desc))
+        
+        for name in rdepends:
+            rdepends[name].sort()
+        
+        self._index = {
+            'version': self._version,
+            'commit_id': self.commit_id(),
+            'rdepends': rdepends,
+            'search': build_search_index(search),
+            'patches': index_patches(os.path.join(self._config.db, 'patches')),
+        }
+    
+    
+    def save(self):
+        
+        if not os.path.exists(self._cache):
+            os.makedirs(self._cache, 0o755)
+        
+        log.info('Saving the index: %s' % self._file)
+        with atomic_open(self._file) as fp:
+            json.dump(self._index, fp)
+    
+    
+    def __getattr__(self, name):
+        
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self._index.get(name, {})
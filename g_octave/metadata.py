@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+    metadata.py
+    ~~~~~~~~~~~
+    
+    This module implements the metadata cache of the overlay (the
+    'md5-dict' format, in metadata/md5-cache), written by g-octave for
+    each ebuild created, so the package manager doesn't need to source
+    the ebuilds to get their metadata.
+    
+    The values of the ebuilds are known by g-octave, but the values added
+    by the eclasses (autotools, mercurial, ...) aren't. They are taken
+    from an entry generated by egencache for the first ebuild of each
+    kind (stable or live, with or without patches), and saved to
+    metadata/g-octave.json, with the MD5 of the eclasses. The package
+    manager generates the entries itself if the eclasses change.
+    
+    A digest of the files used to create each ebuild (the DESCRIPTION
+    file and the patches) is saved to metadata/g-octave-stamps, so the
+    ebuilds outdated by a sync can be found without creating them again.
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'MetadataCache',
+    'layout_conf',
+]
+
+import hashlib
+import io
+import json
+import os
+import subprocess
+
+from .config import Config
+from .compat import atomic_open, open
+
+from .log import Log
+log = Log('g_octave.metadata')
+
+layout_conf = """\
+masters = gentoo
+cache-formats = md5-dict
+"""
+
+# the values that are appended by the eclasses to the values of the ebuilds
+_incremental = ['DEPEND', 'RDEPEND', 'PDEPEND', 'IUSE']
+
+# the values defined only by the eclasses
+_eclass_only = [
+    'DEFINED_PHASES',
+    'INHERIT',
+    'PROPERTIES',
+    'REQUIRED_USE',
+    'RESTRICT',
+    'SRC_URI',
+    '_eclasses_',
+]
+
+
+def _find_command(name):
+    for path in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        command = os.path.join(path, name)
+        if os.path.isfile(command) and os.access(command, os.X_OK):
+            return command
+    return None
+
+
+def _md5(filename):
+    with io.open(filename, 'rb') as fp:
+        return hashlib.md5(fp.read()).hexdigest()
+
+
+def _normalize(value):
+    return ' '.join(value.split())
+
+
+def _read_entry(filename):
+    entry = {}
+    with open(filename) as fp:
+        for line in fp:
+            key, sep, value = line.rstrip('\n').partition('=')
+            if sep:
+                entry[key] = value
+    return entry
+
+
+def _write_entry(filename, entry):
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname, 0o755)
+    with atomic_open(filename) as fp:
+        for key in sorted(entry):
+            if entry[key] != '':
+                fp.write('%s=%s\n' % (key, entry[key]))
+
+
+class MetadataCache(object):
+    
+    # the command that generates the entries used as templates. if None,
+    # or not found, the entries are generated by the package manager
+    egencache = 'egencache'
+    
+    
+    def __init__(self, conf=None):
+        
+        if conf is None:
+            conf = Config()
+        self._config = conf
+        
+        self._cache_dir = os.path.join(conf.overlay, 'metadata', 'md5-cache')
+        self._stamps_dir = os.path.join(
+            conf.overlay, 'metadata', 'g-octave-stamps'
+        )
+        self._templates_file = os.path.join(
+            conf.overlay, 'metadata', 'g-octave.json'
+        )
+        self._templates = None
+        
+        # the kinds of ebuilds that egencache failed to process
+        self._failed = set()
+        
+        # the eclasses of the overlay have precedence
+        self._eclass_dirs = [os.path.join(conf.overlay, 'eclass')]
+        try:
+            import portage
+            self._eclass_dirs.append(
+                os.path.join(portage.settings['PORTDIR'], 'eclass')
+            )
+        except Exception:
+            pass
+    
+    
+    def _eclasses_valid(self, eclasses):
+        fields = eclasses.split('\t')
+        for name, md5 in zip(fields[0::2], fields[1::2]):
+            for eclass_dir in self._eclass_dirs:
+                eclass = os.path.join(eclass_dir, '%s.eclass' % name)
+                if os.path.exists(eclass):
+                    if _md5(eclass) != md5:
+                        return False
+                    break
+            else:
+                return False
+        return True
+    
+    
+    def _load_templates(self):
+        if self._templates is not None:
+            return
+        self._templates = {}
+        if os.path.exists(self._templates_file):
+            try:
+                with open(self._templates_file) as fp:
+                    self._templates = json.load(fp)
+            except ValueError:
+                log.warning('Invalid file: %s' % self._templates_file)
+    
+    
+    def _save_templates(self):
+        with atomic_open(self._templates_file) as fp:
+            json.dump(self._templates, fp, indent=1, sort_keys=True)
+    
+    
+    def _build_template(self, pkgname, version, entry):
+        """runs egencache for an ebuild and extracts the values added by
+        the eclasses from the generated entry.
+        """
+        
+        entry_file = os.path.join(
+            self._cache_dir, 'g-octave', '%s-%s' % (pkgname, version)
+        )
+        
+        egencache = self.egencache
+        if egencache is not None and os.sep not in egencache:
+            egencache = _find_command(egencache)
+        if egencache is None:
+            log.info('egencache not found, the metadata cache isn\'t updated')
+            return None
+        
+        log.info('Running egencache: g-octave/%s-%s' % (pkgname, version))
+        try:
+            ret = subprocess.call([
+                egencache, '--update', '--repo=g-octave',
+                '=g-octave/%s-%s' % (pkgname, version),
+            ])
+        except OSError as error:
+            log.warning('Failed to run egencache: %s' % error)
+            return None
+        if ret != os.EX_OK or not os.path.exists(entry_file):
+            log.warning('egencache failed: g-octave/%s-%s' % (pkgname, version))
+            return None
+        
+        generated = _read_entry(entry_file)
+        p = '%s-%s' % (pkgname, version)
+        
+        template = {}
+        for key in _incremental:
+            mine = _normalize(entry.get(key, ''))
+            theirs = _normalize(generated.get(key, ''))
+            if not theirs.startswith(mine):
+                log.warning('Unexpected %s: g-octave/%s' % (key, p))
+                return None
+            template[key] = theirs[len(mine):].strip()
+        for key in _eclass_only:
+            template[key] = generated.get(key, '').replace(p, '${P}')
+        return template
+    
+    
+    def update(self, pkgname, version, ebuild_file, entry, patched=False):
+        """writes the cache entry of an ebuild. *entry* is a dict with the
+        values defined by the ebuild itself.
+        """
+        
+        self._load_templates()
+        
+        kind = '%s%s' % (
+            version.startswith('9999') and 'live' or 'stable',
+            patched and '-patched' or '',
+        )
+        template = self._templates.get(kind)
+        
+        if template is None or not self._eclasses_valid(template['_eclasses_']):
+            if kind in self._failed:
+                return
+            # egencache writes the entry of this ebuild
+            template = self._build_template(pkgname, version, entry)
+            if template is None:
+                self._failed.add(kind)
+            else:
+                self._templates[kind] = template
+                self._save_templates()
+            return
+        
+        my_entry = dict(entry)
+        for key in _incremental:
+            my_entry[key] = ' '.join(
+                [i for i in [_normalize(entry.get(key, '')), template[key]] if i]
+            )
+        for key in _eclass_only:
+            my_entry[key] = template[key].replace(
+                '${P}', '%s-%s' % (pkgname, version)
+            )
+        my_entry['_md5_'] = _md5(ebuild_file)
+        
+        _write_entry(
+            os.path.join(
+                self._cache_dir, 'g-octave', '%s-%s' % (pkgname, version)
+            ),
+            my_entry
+        )
+    
+    
+    def stamp(self, pkgname, version):
+        """returns the digest of the source files of an ebuild, saved when
+        it was created, or None.
+        """
+        
+        stamp_file = os.path.join(self._stamps_dir, '%s-%s' % (pkgname, version))
+        if not os.path.exists(stamp_file):
+            return None
+        with open(stamp_file) as fp:
+            return fp.read().strip()
+    
+    
+    def set_stamp(self, pkgname, version, digest):
+        
+        if not os.path.exists(self._stamps_dir):
+            os.makedirs(self._stamps_dir, 0o755)
+        stamp_file = os.path.join(self._stamps_dir, '%s-%s' % (pkgname, version))
+        with atomic_open(stamp_file) as fp:
+            fp.write(digest + '\n')
@@ -22,6 +22,7 @@ import portage.output
 
 from .config import Config
 from .exception import ConfigException
+from .metadata import layout_conf
 from .compat import open
 
 out = portage.output.EOutput()
@@ -42,7 +43,7 @@ def create_overlay(force=False, conf=None, quiet=False):
         
         try:
             # creating dirs
-            for _dir in ['profiles', 'eclass']:
+            for _dir in ['profiles', 'eclass', 'metadata']:
                 dir = os.path.join(conf.overlay, _dir)
                 if not os.path.exists(dir) or force:
                     os.makedirs(dir, 0o755)
@@ -51,6 +52,7 @@ def create_overlay(force=False, conf=None, quiet=False):
             files = {
                 os.path.join(conf.overlay, 'profiles', 'repo_name'): 'g-octave',
                 os.path.join(conf.overlay, 'profiles', 'categories'): 'g-octave',
+                os.path.join(conf.overlay, 'metadata', 'layout.conf'): layout_conf,
             }
             
             # symlinking g-octave eclass
@@ -82,3 +84,11 @@ def create_overlay(force=False, conf=None, quiet=False):
         else:
             if not quiet:
                 out.eend(0)
+    
+    # overlays created by older versions of g-octave
+    layout = os.path.join(conf.overlay, 'metadata', 'layout.conf')
+    if not os.path.exists(layout):
+        if not os.path.exists(os.path.dirname(layout)):
+            os.makedirs(os.path.dirname(layout), 0o755)
+        with open(layout, 'w') as fp:
+            fp.write(layout_conf)
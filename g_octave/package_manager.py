@@ -16,19 +16,121 @@ __all__ = [
     'Pkgcore',
     'Paludis',
     'Cave',
+    'BinpkgKeys',
+    'ebuild_key',
 ]
 
+import glob
 import grp
+import hashlib
+import io
+import json
 import os
 import pwd
 import subprocess
+import sys
+import threading
+import time
 
 from g_octave.config import Config
-from g_octave.ebuild import Ebuild
-from g_octave.compat import open
+from g_octave.description import re_pkg_atom
+from g_octave.description_tree import DescriptionTree, version_key
+from g_octave.ebuild import Ebuild, Renderer, source_digest
+from g_octave.metadata import MetadataCache
+from g_octave.vdb import VDB
+from g_octave.compat import atomic_open, open
+
+from g_octave.log import Log
+log = Log('g_octave.package_manager')
 
 conf = Config(True)
 
+
+def _cpv(ebuild_file):
+    return 'g-octave/%s' % os.path.basename(ebuild_file)[:-len('.ebuild')]
+
+
+def ebuild_key(ebuild_file):
+    """returns the key of the binary package built from an ebuild: a
+    digest of the ebuild, of the files used by it (the patches) and of
+    the g-octave eclass.
+    """
+    pkgdir = os.path.dirname(ebuild_file)
+    files = [ebuild_file]
+    files += sorted(glob.glob(os.path.join(pkgdir, 'files', '*')))
+    files.append(os.path.join(
+        os.path.dirname(os.path.dirname(pkgdir)), 'eclass', 'g-octave.eclass'
+    ))
+    my_hash = hashlib.sha1()
+    for filename in files:
+        if os.path.exists(filename):
+            my_hash.update(os.path.basename(filename).encode('utf-8'))
+            with io.open(filename, 'rb') as fp:
+                my_hash.update(fp.read())
+    return my_hash.hexdigest()
+
+
+def _stream(fp, output, log_method, name):
+    # the lines are written as soon as they are read, so the pipe never
+    # fills up
+    for line in iter(fp.readline, b''):
+        output.write(line)
+        output.flush()
+        log_method('%s: %s' % (name, line.decode('utf-8', 'replace').rstrip('\n')))
+    fp.close()
+
+
+def _terminate(proc, wait=10):
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+    deadline = time.time() + wait
+    while proc.poll() is None and time.time() < deadline:
+        time.sleep(0.1)
+    if proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+
+class BinpkgKeys(object):
+    """the keys of the ebuilds that built the binary packages, saved with
+    the binary packages. A binary package is reused only by the hosts
+    that generated exactly the same ebuild.
+    """
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self.keys = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename) as fp:
+                    self.keys = json.load(fp)
+            except ValueError:
+                log.warning('Invalid file: %s' % filename)
+    
+    def stale(self, ebuild_files):
+        """returns the names (category/package, as accepted by
+        --usepkg-exclude) of the ebuilds without a binary package built
+        from them.
+        """
+        stale = []
+        for ebuild_file in ebuild_files:
+            catpkg = 'g-octave/%s' % os.path.basename(os.path.dirname(ebuild_file))
+            if catpkg not in stale and \
+               self.keys.get(_cpv(ebuild_file)) != ebuild_key(ebuild_file):
+                stale.append(catpkg)
+        return stale
+    
+    def update(self, ebuild_files):
+        for ebuild_file in ebuild_files:
+            self.keys[_cpv(ebuild_file)] = ebuild_key(ebuild_file)
+        dirname = os.path.dirname(self.filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, 0o755)
+        with atomic_open(self.filename) as fp:
+            json.dump(self.keys, fp, indent=1, sort_keys=True)
+
+
 class Base:
     
     _client = ''
@@ -40,14 +142,200 @@ class Base:
     check_overlay = lambda a,b,c: True
     create_manifest = lambda a,b: os.EX_OK
     
+    _binpkg = False
+    _pretend = False
+    
+    # the package manager asks questions to the user
+    _interactive = False
+    
+    # the ebuild files of the packages being merged, with the binary
+    # packages enabled
+    ebuilds = []
+    
+    def _run(self, command):
+        """runs a command, writing its stdout and stderr to the terminal and
+        to the log, line by line. The command is terminated after the
+        number of seconds of the option 'command_timeout', or on SIGINT.
+        With an interactive package manager, the stdio is inherited and
+        only the duration is logged. returns the return code.
+        """
+        
+        timeout = conf.command_timeout.strip()
+        timeout = timeout != '' and float(timeout) or None
+        name = os.path.basename(command[0])
+        
+        log.info('Running: %s' % ' '.join(command))
+        start = time.time()
+        threads = []
+        if self._interactive:
+            proc = subprocess.Popen(command)
+        else:
+            proc = subprocess.Popen(
+                command,
+                stdout = subprocess.PIPE,
+                stderr = subprocess.PIPE,
+            )
+            for fp, output, log_method in [
+                (proc.stdout, getattr(sys.stdout, 'buffer', sys.stdout), log.info),
+                (proc.stderr, getattr(sys.stderr, 'buffer', sys.stderr), log.warning),
+            ]:
+                thread = threading.Thread(
+                    target = _stream,
+                    args = (fp, output, log_method, name),
+                )
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+        
+        try:
+            while proc.poll() is None:
+                if timeout is not None and time.time() - start > timeout:
+                    log.error('Timeout (%.0f seconds): %s' % (timeout, name))
+                    _terminate(proc)
+                    break
+                time.sleep(0.1)
+        except (KeyboardInterrupt, SystemExit):
+            # the SIGINT handler of the g-octave script raises SystemExit
+            log.error('Interrupted: %s' % name)
+            _terminate(proc)
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+        
+        log.info('Finished: %s (return code %i, %.2f seconds)' % (
+            name, proc.returncode, time.time() - start
+        ))
+        return proc.returncode
+    
     def is_installed(self):
         if self._client != '':
             return os.path.exists(self._client)
         return False
     
-    def do_ebuilds(self, packages):
+    def _atoms(self, pkgatom):
+        # the package manager commands accepts a single atom or a list
+        if isinstance(pkgatom, (list, tuple)):
+            return list(pkgatom)
+        return [pkgatom]
+    
+    def outdated_packages(self):
+        """returns a list of tuples (catpkg, force) with the g-octave
+        packages installed that have a newer version available, or whose
+        DESCRIPTION file or patches changed since their ebuilds were
+        created (force is True for them). the ebuilds created without a
+        stamp (by older versions of g-octave) are considered up to date,
+        and the stamp of their current sources is saved.
+        """
+        tree = DescriptionTree(conf = conf)
+        metadata = MetadataCache(conf)
+        renderer = Renderer(conf, index = tree.index())
+        outdated = []
+        for record in VDB(conf).packages():
+            catpkg = 'g-octave/%s' % record['name']
+            latest = tree.latest_version(record['name'])
+            # removed from the package database, or an unknown version
+            if latest is None or re_pkg_atom.match('%s-%s' % (
+                record['name'], record['version']
+            )) is None:
+                continue
+            if version_key(latest) > version_key(record['version']):
+                outdated.append((catpkg, False))
+            elif latest == record['version']:
+                digest = source_digest(
+                    conf, tree, renderer, record['name'], record['version']
+                )
+                stamp = metadata.stamp(record['name'], record['version'])
+                if stamp is None:
+                    try:
+                        metadata.set_stamp(
+                            record['name'], record['version'], digest
+                        )
+                    except (IOError, OSError) as error:
+                        log.info('Failed to save the stamp: %s' % error)
+                elif stamp != digest:
+                    outdated.append((catpkg, True))
+        return outdated
+    
+    def _update_all(self):
+        """creates the ebuilds of the packages that need an update, and
+        returns their atoms. the packages are read from the VDB, so they
+        may be dependencies of other packages, that shouldn't be added to
+        the world file: the package manager is called with --oneshot.
+
+        the packages changed are merged again with the same version, so
+        they are returned as '=g-octave/pkg-ver', and all the targets must
+        be merged, even if their version is installed.
+        """
+        outdated = self.outdated_packages()
+        if len(outdated) == 0:
+            log.info('All the installed packages are up to date.')
+            return []
+        force = [i[0] for i in outdated if i[1]]
+        atoms = self.do_ebuilds([i[0] for i in outdated], force = force)
+        return [
+            forced and atom or catpkg
+            for (catpkg, forced), atom in zip(outdated, atoms)
+        ]
+    
+    def do_ebuilds(self, packages, force=[]):
+        """creates the ebuilds of the packages and of their dependencies,
+        and returns the atoms of the packages.
+        """
+        tree = DescriptionTree(conf = conf)
+        metadata = MetadataCache(conf)
+        renderer = Renderer(conf, index = tree.index())
+        self.ebuilds = []
+        atoms = []
         for package in packages:
-            Ebuild(package[len('g-octave/'):], pkg_manager=self).create()
+            atom, catpkg = Ebuild(
+                package[len('g-octave/'):],
+                force = package in force,
+                conf = conf,
+                pkg_manager = self,
+                tree = tree,
+                metadata = metadata,
+                renderer = renderer,
+            ).create(resolved = self.ebuilds)
+            atoms.append(atom)
+        return atoms
+    
+    def _binpkg_command(self, command, stale):
+        log.warning('Binary packages not supported by the package manager.')
+        return command
+    
+    def _binpkg_keys_file(self):
+        # saved with the binary packages
+        import portage
+        return os.path.join(portage.settings['PKGDIR'], 'g-octave', 'keys.json')
+    
+    def _merge(self, command):
+        """runs a command that merges packages. With the binary packages
+        enabled, the binary packages are built, and reused if their keys
+        match the current ebuilds.
+        """
+        if not self._binpkg:
+            return self.run_command(command)
+        keys = BinpkgKeys(self._binpkg_keys_file())
+        # the ebuilds of the packages merged: the targets and the
+        # dependencies created with them
+        ebuilds = list(self.ebuilds)
+        for arg in command:
+            match = re_pkg_atom.match(arg[len('=g-octave/'):])
+            if arg.startswith('=g-octave/') and match is not None:
+                ebuild_file = os.path.join(
+                    conf.overlay, 'g-octave', match.group(1),
+                    '%s.ebuild' % arg[len('=g-octave/'):]
+                )
+                if ebuild_file not in ebuilds:
+                    ebuilds.append(ebuild_file)
+        stale = keys.stale(ebuilds)
+        if len(stale) > 0:
+            log.info('Binary packages not reused: %s' % ', '.join(stale))
+        ret = self.run_command(self._binpkg_command(command, stale))
+        if ret == os.EX_OK and not self._pretend:
+            keys.update(ebuilds)
+        return ret
     
     def allowed_users(self):
         if self._group is None:
@@ -72,42 +360,49 @@ class Portage(Base):
         '# emerge -av --depclean',
     ]
     
-    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False):
+    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False, binpkg=False):
+        self._binpkg = binpkg
+        self._pretend = pretend
         self.overlay_bootstrap()
+        self._interactive = ask
         self._fullcommand = [self._client]
         ask and self._fullcommand.append('--ask')
         verbose and self._fullcommand.append('--verbose')
         pretend and self._fullcommand.append('--pretend')
         oneshot and self._fullcommand.append('--oneshot')
-        nocolor and self._fullcommand.append('--color=n')
+        if nocolor:
+            self._fullcommand.append('--color=n')
+        elif sys.stdout.isatty():
+            # the output of emerge is piped, and loses the colors otherwise
+            self._fullcommand.append('--color=y')
     
     def run_command(self, command):
-        return subprocess.call(self._fullcommand + command)
+        return self._run(self._fullcommand + command)
+    
+    def _binpkg_command(self, command, stale):
+        cmd = ['--buildpkg', '--usepkg']
+        if len(stale) > 0:
+            cmd += ['--usepkg-exclude', ' '.join(stale)]
+        return cmd + command
     
     def install_package(self, pkgatom, catpkg):
-        return self.run_command([pkgatom])
+        return self._merge(self._atoms(pkgatom))
 
     def uninstall_package(self, pkgatom, catpkg):
-        return self.run_command(['--unmerge', pkgatom])
+        return self.run_command(['--unmerge'] + self._atoms(pkgatom))
     
     def update_package(self, pkgatom=None, catpkg=None):
         if pkgatom is None:
-            pkgatom = self.installed_packages()
-        else:
-            pkgatom = [pkgatom]
-        self.do_ebuilds(pkgatom)
-        return self.run_command(['--update'] + pkgatom)
-    
-    def installed_packages(self):
-        packages = []
-        with open('/var/lib/portage/world') as fp:
-            for line in fp:
-                if line.startswith('g-octave/'):
-                    packages.append(line.strip())
-        return packages
+            pkgatom = self._update_all()
+            if len(pkgatom) == 0:
+                return os.EX_OK
+            # all the targets are merged, see _update_all
+            return self._merge(['--oneshot'] + pkgatom)
+        # the ebuilds of the packages required were already created
+        return self._merge(['--update'] + self._atoms(pkgatom))
     
     def create_manifest(self, ebuild):
-        return subprocess.call(['ebuild', ebuild, 'manifest'])
+        return self._run(['ebuild', ebuild, 'manifest'])
     
     def check_overlay(self, overlay, out):
         import portage
@@ -135,7 +430,10 @@ class Pkgcore(Base):
         '# pmerge -av --clean',
     ]
     
-    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False):
+    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False, binpkg=False):
+        self._binpkg = binpkg
+        self._pretend = pretend
+        self._interactive = ask
         self._fullcommand = [self._client]
         ask and self._fullcommand.append('--ask')
         verbose and self._fullcommand.append('--verbose')
@@ -144,39 +442,34 @@ class Pkgcore(Base):
         nocolor and self._fullcommand.append('--nocolor')
     
     def run_command(self, command):
-        return subprocess.call(self._fullcommand + command)
+        return self._run(self._fullcommand + command)
+    
+    def _binpkg_command(self, command, stale):
+        # pmerge can't exclude packages from --usepkg
+        cmd = ['--buildpkg']
+        if len(stale) == 0:
+            cmd.append('--usepkg')
+        return cmd + command
     
     def install_package(self, pkgatom, catpkg):
-        return self.run_command([pkgatom])
+        return self._merge(self._atoms(pkgatom))
 
     def uninstall_package(self, pkgatom, catpkg):
-        return self.run_command(['--unmerge', pkgatom])
+        return self.run_command(['--unmerge'] + self._atoms(pkgatom))
     
     def update_package(self, pkgatom=None, catpkg=None):
         if pkgatom is None:
-            pkgatom = self.installed_packages()
-        else:
-            pkgatom = [pkgatom]
-        self.do_ebuilds(pkgatom)
-        return self.run_command(['--upgrade', '--noreplace'] + pkgatom)
-    
-    def installed_packages(self):
-        packages = []
-        p = subprocess.Popen([
-            'pquery',
-            '--vdb',
-            '--pkgset=world',
-            '--no-version',
-            'g-octave/*',
-        ], stdout=subprocess.PIPE)
-        if p.wait() == os.EX_OK:
-            for line in p.stdout:
-                packages.append(line.strip())
-        return packages
+            pkgatom = self._update_all()
+            if len(pkgatom) == 0:
+                return os.EX_OK
+            # all the targets are merged, see _update_all
+            return self._merge(['--oneshot'] + pkgatom)
+        # the ebuilds of the packages required were already created
+        return self._merge(['--upgrade', '--noreplace'] + self._atoms(pkgatom))
     
     def create_manifest(self, ebuild):
         # using portage :(
-        return subprocess.call(['ebuild', ebuild, 'manifest'])
+        return self._run(['ebuild', ebuild, 'manifest'])
 
 
 class Paludis(Base):
@@ -189,7 +482,9 @@ class Paludis(Base):
         '# paludis --pretend --uninstall-unused',
     ]
     
-    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False):
+    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False, binpkg=False):
+        self._binpkg = binpkg
+        self._pretend = pretend
         self._fullcommand = [self._client]
         self._oneshot = oneshot
         # paludis doesn't supports '--ask'
@@ -204,7 +499,7 @@ class Paludis(Base):
         nocolor and self._fullcommand.append('--no-color')
     
     def run_command(self, command):
-        return subprocess.call(self._fullcommand + command)
+        return self._run(self._fullcommand + command)
     
     def install_package(self, pkgatom, catpkg):
         cmd = [
@@ -212,37 +507,33 @@ class Paludis(Base):
             '--dl-upgrade', 'as-needed'
         ]
         if not self._oneshot:
-            cmd += ['--add-to-world-spec', catpkg]
-        cmd.append(pkgatom)
-        return self.run_command(cmd)
+            catpkg = self._atoms(catpkg)
+            if len(catpkg) == 1:
+                cmd += ['--add-to-world-spec', catpkg[0]]
+            else:
+                cmd += ['--add-to-world-spec', '( %s )' % ' '.join(catpkg)]
+        return self._merge(cmd + self._atoms(pkgatom))
 
     def uninstall_package(self, pkgatom, catpkg):
-        return self.run_command(['--uninstall', pkgatom])
+        return self.run_command(['--uninstall'] + self._atoms(pkgatom))
     
     def update_package(self, pkgatom=None, catpkg=None):
-        if pkgatom is None:
-            pkgatom = self.installed_packages()
-        else:
-            pkgatom = [pkgatom]
-        self.do_ebuilds(pkgatom)
-        return self.run_command([
+        cmd = [
             '--install',
             '--dl-upgrade', 'as-needed',
-            '--dl-reinstall-targets', 'never',
-        ] + pkgatom)
-    
-    def installed_packages(self):
-        packages = []
-        p = subprocess.Popen([
-            'cave',
-            'print-ids',
-            '--matching', 'g-octave/*::installed',
-            '--format', '%c/%p\n',
-        ], stdout=subprocess.PIPE)
-        if p.wait() == os.EX_OK:
-            for line in p.stdout:
-                packages.append(line.strip())
-        return packages
+        ]
+        if pkgatom is None:
+            pkgatom = self._update_all()
+            if len(pkgatom) == 0:
+                return os.EX_OK
+            cmd += ['--dl-reinstall-targets', 'always']
+            if not self._oneshot:
+                cmd.append('--preserve-world')
+        else:
+            cmd += ['--dl-reinstall-targets', 'never']
+            # the ebuilds of the packages required were already created
+            pkgatom = self._atoms(pkgatom)
+        return self._merge(cmd + pkgatom)
 
 class Cave(Base):
     
@@ -254,7 +545,9 @@ class Cave(Base):
         '# cave purge',
     ]
     
-    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False):
+    def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False, binpkg=False):
+        self._binpkg = binpkg
+        self._pretend = pretend
         self._fullcommand = [self._client]
         self._cmd = ['-z']
         oneshot and self._cmd.append('-1')
@@ -268,32 +561,30 @@ class Cave(Base):
         #cave doesn't support '--no-color'
     
     def run_command(self, command):
-        return subprocess.call(self._fullcommand + command + self._cmd)
+        return self._run(self._fullcommand + command + self._cmd)
+    
+    def _binpkg_command(self, command, stale):
+        # the binary packages are built to the repository configured as
+        # destination, and cave prefers them to the ebuilds by itself. cave
+        # can't exclude packages from the binary packages reused
+        if len(stale) > 0:
+            return command
+        return command[:1] + ['--via-binary', 'g-octave/*'] + command[1:]
     
     def install_package(self, pkgatom, catpkg):
-        return self.run_command(['resolve'] + [pkgatom])
+        return self._merge(['resolve'] + self._atoms(pkgatom))
 
     def uninstall_package(self, pkgatom, catpkg):
-        return self.run_command(['uninstall'] + [pkgatom])
+        return self.run_command(['uninstall'] + self._atoms(pkgatom))
     
     def update_package(self, pkgatom=None, catpkg=None):
-        cmd = ['-1','-K','s','-k','s']
         if pkgatom is None:
-            pkgatom = self.installed_packages()
+            pkgatom = self._update_all()
+            if len(pkgatom) == 0:
+                return os.EX_OK
+            cmd = ['-1','-K','n','-k','s']
         else:
-            pkgatom = [pkgatom]
-        self.do_ebuilds(pkgatom)
-        return self.run_command(['resolve'] + cmd + pkgatom)
-    
-    def installed_packages(self):
-        packages = []
-        p = subprocess.Popen([
-            'cave',
-            'print-ids',
-            '--matching', 'g-octave/*::installed',
-            '--format', '%c/%p\n',
-        ], stdout=subprocess.PIPE)
-        if p.wait() == os.EX_OK:
-            for line in p.stdout:
-                packages.append(line.strip())
-        return packages
+            cmd = ['-1','-K','s','-k','s']
+            # the ebuilds of the packages required were already created
+            pkgatom = self._atoms(pkgatom)
+        return self._merge(['resolve'] + cmd + pkgatom)
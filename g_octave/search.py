@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+    search.py
+    ~~~~~~~~~
+    
+    This module implements the search engine of g-octave. The searches
+    are done on an inverted index (field -> token -> packages) built at
+    sync time from the DESCRIPTION files, and stored in the index of the
+    package database.
+    
+    Queries are lists of terms separated by spaces. All the terms should
+    match. The terms are prefixes of the words of the fields (e.g. "sig"),
+    or regular expressions between slashes (e.g. "/^sig.*l$/"), and can
+    be limited to a field (e.g. "categories:signal").
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'Search',
+    'build_search_index',
+    'fields',
+]
+
+import bisect
+import re
+
+from .exception import SearchException
+
+# fields of the DESCRIPTION files indexed, and their weights on the ranking
+fields = ('name', 'description', 'categories', 'maintainer')
+_weights = {
+    'name': 8,
+    'categories': 4,
+    'description': 2,
+    'maintainer': 1,
+}
+
+re_token = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(field, pkgname, desc):
+    
+    if field == 'name':
+        # the full name is indexed too, to allow matches with hyphens
+        return set(re_token.findall(pkgname.lower()) + [pkgname.lower()])
+    
+    value = getattr(desc, field)
+    if value is None:
+        return set()
+    return set(re_token.findall(value.lower()))
+
+
+def build_search_index(packages):
+    """returns the inverted index for a list of tuples (pkgname, desc),
+    sorted by pkgname, where *desc* is a *g_octave.Description* object.
+    """
+    
+    index = dict([(field, {}) for field in fields])
+    seen = dict([(field, {}) for field in fields])
+    
+    for pkgname, desc in packages:
+        for field in fields:
+            for token in _tokens(field, pkgname, desc):
+                # the versions of a package aren't always sequential on
+                # the list (e.g. foo-1.0, foo-2d-1.0, foo-3.0)
+                pkgnames = seen[field].setdefault(token, set())
+                if pkgname not in pkgnames:
+                    pkgnames.add(pkgname)
+                    index[field].setdefault(token, []).append(pkgname)
+    
+    return index
+
+
+class Search(object):
+    
+    def __init__(self, index):
+        
+        self._index = index
+        
+        # sorted list of tokens, for the prefix searches
+        self._tokens = {}
+        for field in fields:
+            self._tokens[field] = sorted(index.get(field, {}))
+    
+    
+    def _match_tokens(self, field, pattern, regex):
+        
+        tokens = self._tokens[field]
+        
+        if regex is not None:
+            return [i for i in tokens if regex.search(i) is not None]
+        
+        matches = []
+        pos = bisect.bisect_left(tokens, pattern)
+        while pos < len(tokens) and tokens[pos].startswith(pattern):
+            matches.append(tokens[pos])
+            pos += 1
+        return matches
+    
+    
+    def _term(self, term):
+        """returns a dict with the packages matched by a term, and their
+        scores.
+        """
+        
+        my_fields = fields
+        if ':' in term:
+            field, pattern = term.split(':', 1)
+            if field in fields:
+                my_fields = (field,)
+                term = pattern
+        
+        regex = None
+        if len(term) > 2 and term.startswith('/') and term.endswith('/'):
+            try:
+                regex = re.compile(term[1:-1], re.IGNORECASE)
+            except re.error as error:
+                raise SearchException(
+                    'Invalid regular expression: %s (%s)' % (term, error)
+                )
+        else:
+            term = term.lower()
+        
+        scores = {}
+        for field in my_fields:
+            for token in self._match_tokens(field, term, regex):
+                score = _weights[field]
+                if token == term:
+                    # exact matches are better
+                    score *= 2
+                for pkgname in self._index[field][token]:
+                    scores[pkgname] = scores.get(pkgname, 0) + score
+        
+        return scores
+    
+    
+    def query(self, query):
+        """returns a list of package names matching the query, from the best
+        match to the worst.
+        """
+        
+        scores = None
+        
+        for term in query.split():
+            term_scores = self._term(term)
+            if scores is None:
+                scores = term_scores
+                continue
+            for pkgname in list(scores.keys()):
+                if pkgname in term_scores:
+                    scores[pkgname] += term_scores[pkgname]
+                else:
+                    del scores[pkgname]
+        
+        if scores is None:
+            return []
+        
+        return sorted(scores, key=lambda pkgname: (-scores[pkgname], pkgname))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+    vdb.py
+    ~~~~~~
+    
+    This module implements a reader of the installed packages database
+    (VDB) of the g-octave packages, used by all the package managers. The
+    result of the directory scan is cached in the package database, and
+    reused while the modification time of the VDB directory doesn't
+    change.
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['VDB']
+
+import json
+import os
+import re
+
+from .config import Config
+from .compat import atomic_open, open
+
+from .log import Log
+log = Log('g_octave.vdb')
+
+# name-version[-rN]
+re_vdb_entry = re.compile(r'^(.+)-([0-9][^-]*)(-r[0-9]+)?$')
+
+
+class VDB(object):
+    
+    def __init__(self, conf=None, vdb_dir='/var/db/pkg'):
+        
+        if conf is None:
+            conf = Config(True)
+        self._config = conf
+        
+        self._dir = os.path.join(vdb_dir, 'g-octave')
+        self._cache_file = os.path.join(conf.db, 'cache', 'vdb.json')
+    
+    
+    def _scan(self):
+        packages = []
+        for entry in os.listdir(self._dir):
+            # the packages being merged (-MERGING-*) and the temporary files
+            if entry.startswith('-') or entry.startswith('.'):
+                continue
+            match = re_vdb_entry.match(entry)
+            if match is None:
+                log.warning('Invalid VDB entry: g-octave/%s' % entry)
+                continue
+            packages.append({
+                'name': match.group(1),
+                'version': match.group(2),
+            })
+        packages.sort(key=lambda i: (i['name'], i['version']))
+        return packages
+    
+    
+    def packages(self):
+        """returns a list of dicts with the name and the version of the
+        g-octave packages installed.
+        """
+        
+        try:
+            mtime = os.stat(self._dir).st_mtime
+        except OSError:
+            return []
+        
+        if os.path.exists(self._cache_file):
+            try:
+                with open(self._cache_file) as fp:
+                    cache = json.load(fp)
+                if cache['mtime'] == mtime:
+                    return cache['packages']
+            except (ValueError, KeyError):
+                log.warning('Invalid file: %s' % self._cache_file)
+        
+        packages = self._scan()
+        
+        dirname = os.path.dirname(self._cache_file)
+        try:
+            if not os.path.exists(dirname):
+                os.makedirs(dirname, 0o755)
+            with atomic_open(self._cache_file) as fp:
+                json.dump({'mtime': mtime, 'packages': packages}, fp)
+        except (IOError, OSError) as error:
+            # the cache is optional
+            log.info('Failed to save the VDB cache: %s' % error)
+        
+        return packages
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_api.py
+    ~~~~~~~~~~~
+    
+    test suite for the *g_octave.api* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import json
+import unittest
+import utils
+
+from g_octave import api
+from g_octave.compat import StringIO
+
+
+class TestApi(unittest.TestCase):
+    
+    def setUp(self):
+        conf, self._config_file, self._tempdir = utils.create_env()
+        self._query = api.Query(conf)
+    
+    def test_list(self):
+        records = list(self._query.list())
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[0], {
+            'category': 'extra',
+            'name': 'extra1',
+            'versions': ['0.0.1', '9999'],
+        })
+        self.assertEqual(
+            [i['atom'] for i in self._query.list_raw()],
+            self._query.tree().packages(),
+        )
+    
+    def test_info(self):
+        record = self._query.info('main2')
+        self.assertEqual(record['version'], '0.0.2')
+        self.assertEqual(record['url'], 'http://main2.org')
+        self.assertEqual(self._query.info('main2-0.0.1')['version'], '0.0.1')
+    
+    def test_formats(self):
+        records = [
+            {'atom': 'main1-0.0.1', 'versions': ['0.0.1', '9999']},
+            {'atom': 'main2-0.0.1', 'versions': None},
+        ]
+        fields = ('atom', 'versions')
+        outputs = {
+            'json': lambda x: json.loads(x),
+            'jsonl': lambda x: [json.loads(i) for i in x.splitlines()],
+        }
+        for format in outputs:
+            fp = StringIO()
+            api.write_records(iter(records), format, fields, fp)
+            self.assertEqual(outputs[format](fp.getvalue()), records)
+        fp = StringIO()
+        api.write_records(iter(records), 'tsv', fields, fp)
+        self.assertEqual(
+            fp.getvalue(),
+            'main1-0.0.1\t0.0.1,9999\nmain2-0.0.1\t\n'
+        )
+    
+    def tearDown(self):
+        utils.clean_env(self._config_file, self._tempdir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestApi('test_list'))
+    suite.addTest(TestApi('test_info'))
+    suite.addTest(TestApi('test_formats'))
+    return suite
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_daemon.py
+    ~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.daemon* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import threading
+import time
+import unittest
+import utils
+
+from g_octave import api, daemon, exception
+
+# the ebuilds can't be created without portage
+try:
+    from g_octave import ebuild, package_manager
+except ImportError:
+    ebuild = None
+
+
+class TestDaemon(unittest.TestCase):
+    
+    def setUp(self):
+        conf, self._config_file, self._tempdir = utils.create_env(json_files=True)
+        self._config = conf
+        self._socket = os.path.join(self._tempdir, 'g-octave.sock')
+        self._query = api.Query(conf)
+        self._daemon = daemon.Daemon(conf, socket_path=self._socket)
+        self._thread = threading.Thread(target=self._daemon.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        for i in range(100):
+            self._client = daemon.connect(self._socket, conf)
+            if self._client is not None:
+                break
+            time.sleep(0.05)
+    
+    def test_queries(self):
+        self.assertTrue(self._client is not None)
+        self.assertEqual(self._client.list(), list(self._query.list()))
+        self.assertEqual(self._client.list_raw(), list(self._query.list_raw()))
+        self.assertEqual(
+            self._client.search('name:main'),
+            list(self._query.search('name:main')),
+        )
+        self.assertEqual(self._client.info('main1'), self._query.info('main1'))
+        self.assertEqual(
+            self._client.rdepends('main1'),
+            list(self._query.rdepends('main1')),
+        )
+    
+    def test_errors(self):
+        self.assertRaises(
+            exception.DescriptionTreeException,
+            self._client.info,
+            'foo',
+        )
+        self.assertRaises(
+            exception.SearchException,
+            self._client.search,
+            '/(main/',
+        )
+        self.assertRaises(
+            exception.DaemonException,
+            self._client.request,
+            'foo',
+        )
+    
+    def test_local_tree(self):
+        # with --prefetch, the ebuilds are created locally, using the tree
+        # of the client
+        resolved = []
+        atom, catpkg = ebuild.Ebuild(
+            'main1',
+            conf = self._config,
+            tree = self._client.tree(),
+        ).create(display_info=False, manifest=False, resolved=resolved)
+        self.assertEqual(atom, '=g-octave/main1-0.0.1')
+        self.assertTrue(os.path.exists(resolved[0]))
+    
+    def test_generate(self):
+        self._daemon._pkg_manager = package_manager.Base()
+        records = self._client.generate(['main2-0.0.2', 'main1'])
+        ebuilds = os.path.join(self._config.overlay, 'g-octave')
+        self.assertEqual(records, [
+            {
+                'atom': '=g-octave/main2-0.0.2',
+                'catpkg': 'g-octave/main2',
+                'ebuilds': [
+                    os.path.join(ebuilds, 'main2', 'main2-0.0.2.ebuild'),
+                    os.path.join(ebuilds, 'main1', 'main1-0.0.1.ebuild'),
+                ],
+            },
+            {
+                'atom': '=g-octave/main1-0.0.1',
+                'catpkg': 'g-octave/main1',
+                'ebuilds': [],
+            },
+        ])
+    
+    def tearDown(self):
+        self._client.close()
+        self._daemon.shutdown()
+        self._thread.join()
+        utils.clean_env(self._config_file, self._tempdir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestDaemon('test_queries'))
+    suite.addTest(TestDaemon('test_errors'))
+    if ebuild is not None:
+        suite.addTest(TestDaemon('test_local_tree'))
+        suite.addTest(TestDaemon('test_generate'))
+    return suite
@@ -12,10 +12,11 @@
 """
 
 import os
+import pickle
 import unittest
 import utils
 
-from g_octave import description
+from g_octave import description, exception
 
 
 class TestDescription(unittest.TestCase):
@@ -199,15 +200,119 @@ class TestDescription(unittest.TestCase):
         self.assertEqual(self.desc.autoload, 'NO')
         self.assertEqual(self.desc.license, 'GPL version 3 or later')
 
+    def test_pickle(self):
+        desc = pickle.loads(pickle.dumps(self.desc, 2))
+        self.assertEqual(desc.name, 'package name')
+        self.assertEqual(desc.depends, ['>=sci-mathematics/octave-3.0.0'])
+        self.assertEqual(desc.self_depends, self.desc.self_depends)
+
     def tearDown(self):
         # removing the temp tree
         utils.clean_env(self._config_file, self._tempdir)
 
 
+class HgHandler(utils.HTTPHandler):
+    
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"etag"':
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        with open(self.server.description, 'rb') as fp:
+            content = fp.read()
+        self.send_response(200)
+        self.send_header('ETag', '"etag"')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TestHgDescription(unittest.TestCase):
+    
+    def setUp(self):
+        self._server = utils.start_server(HgHandler)
+        self._server.requests = []
+        self._server.description = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'files', 'DESCRIPTION',
+        )
+        self._url = description.HgDescription._url
+        description.HgDescription._url = self._server.url
+        self._conf, self._config_file, self._tempdir = utils.create_env(json_files=True)
+    
+    def test_cache(self):
+        desc = description.HgDescription('main', 'pkg', conf=self._conf)
+        self.assertEqual(desc.name, 'package name')
+        self.assertEqual(self._server.requests, [None])
+        
+        # cached, not expired
+        desc = description.HgDescription('main', 'pkg', conf=self._conf)
+        self.assertEqual(desc.name, 'package name')
+        self.assertEqual(self._server.requests, [None])
+        
+        # expired, revalidated
+        os.environ['GOCTAVE_SCM_CACHE_TTL'] = '0'
+        try:
+            desc = description.HgDescription('main', 'pkg', conf=self._conf)
+        finally:
+            del os.environ['GOCTAVE_SCM_CACHE_TTL']
+        self.assertEqual(desc.name, 'package name')
+        self.assertEqual(self._server.requests, [None, '"etag"'])
+    
+    def test_invalid_meta(self):
+        description.HgDescription('main', 'pkg', conf=self._conf)
+        meta_file = description.HgDescription._cache_files(self._conf, 'pkg')[1]
+        with open(meta_file, 'w') as fp:
+            fp.write('{invalid')
+        desc = description.HgDescription('main', 'pkg', conf=self._conf)
+        self.assertEqual(desc.name, 'package name')
+        self.assertEqual(self._server.requests, [None, None])
+    
+    def test_user_cache(self):
+        # the package database isn't writable
+        with open(os.path.join(self._conf.db, 'cache'), 'w') as fp:
+            fp.write('')
+        xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self._tempdir, 'user')
+        try:
+            desc = description.HgDescription('main', 'pkg', conf=self._conf)
+        finally:
+            if xdg_cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = xdg_cache_home
+        self.assertEqual(desc.name, 'package name')
+        self.assertTrue(os.path.exists(os.path.join(
+            self._tempdir, 'user', 'g-octave', 'scm', 'pkg.DESCRIPTION'
+        )))
+    
+    def test_offline(self):
+        description.HgDescription.offline = True
+        try:
+            self.assertRaises(
+                exception.DescriptionException,
+                description.HgDescription, 'main', 'pkg', self._conf
+            )
+        finally:
+            description.HgDescription.offline = False
+        self.assertEqual(self._server.requests, [])
+    
+    def tearDown(self):
+        description.HgDescription._url = self._url
+        utils.stop_server(self._server)
+        utils.clean_env(self._config_file, self._tempdir)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(TestDescription('test_re_depends'))
     suite.addTest(TestDescription('test_re_pkg_atom'))
     suite.addTest(TestDescription('test_attributes'))
+    suite.addTest(TestDescription('test_pickle'))
+    suite.addTest(TestHgDescription('test_cache'))
+    suite.addTest(TestHgDescription('test_invalid_meta'))
+    suite.addTest(TestHgDescription('test_user_cache'))
+    suite.addTest(TestHgDescription('test_offline'))
     return suite
 
@@ -16,14 +16,14 @@ import shutil
 import unittest
 import utils
 
-from g_octave import description, description_tree
+from g_octave import description, description_tree, index
 
 
 class TestDescriptionTree(unittest.TestCase):
     
     def setUp(self):
-        conf, self._config_file, self._tempdir = utils.create_env()
-        self._tree = description_tree.DescriptionTree(conf = conf)
+        self._config, self._config_file, self._tempdir = utils.create_env()
+        self._tree = description_tree.DescriptionTree(conf = self._config)
     
     def test_package_versions(self):
         versions = {
@@ -75,6 +75,28 @@ class TestDescriptionTree(unittest.TestCase):
         for ver, latest in versions:
             self.assertEqual(self._tree.version_compare(ver), latest)
     
+    def test_version_key(self):
+        # (lower, greater), ordered as portage.versions.vercmp does
+        versions = [
+            ('1', '2'),
+            ('1.9', '1.10'),
+            ('1.02', '1.1'),
+            ('1.01', '1.02'),
+            ('1.0', '1.0.0'),
+            ('1.0.9', '1.1'),
+            ('1.001', '1.01'),
+            ('9', '9999'),
+        ]
+        for lower, greater in versions:
+            self.assertTrue(
+                description_tree.version_key(lower) <
+                description_tree.version_key(greater)
+            )
+        self.assertEqual(
+            description_tree.version_key('1.010'),
+            description_tree.version_key('1.01'),
+        )
+    
     def test_description_files(self):
         packages = [
             ('main', 'main1', '0.0.1'),
@@ -95,6 +117,63 @@ class TestDescriptionTree(unittest.TestCase):
                 )
             ) 
     
+    def test_load_all(self):
+        packages = self._tree.packages()
+        for workers in (1, 2):
+            descriptions = list(self._tree.load_all(workers = workers))
+            self.assertEqual(len(descriptions), len(packages))
+            for pkg, desc in zip(packages, descriptions):
+                self.assertTrue(isinstance(desc, description.Description))
+                self.assertTrue(pkg.endswith('-' + desc.version))
+    
+    def test_rdepends(self):
+        rdepends = {
+            'main1': ['extra2-0.0.2', 'main2-0.0.2'],
+            'main2': ['language2-0.0.2'],
+            'extra1': [],
+            'extra2': [],
+            'language1': [],
+            'language2': [],
+        }
+        for pkg in rdepends:
+            self.assertEqual(self._tree.rdepends(pkg), rdepends[pkg])
+    
+    def test_patches(self):
+        patches = self._tree.index().patches
+        self.assertEqual(sorted(patches), [
+            'extra1-0.0.1', 'language1-0.0.1', 'main1-0.0.1',
+        ])
+        self.assertEqual(
+            patches['main1-0.0.1'],
+            ['001_main1-0.0.1.patch', '002_main1-0.0.1.patch'],
+        )
+    
+    def test_index(self):
+        cache = os.path.join(self._config.db, 'cache')
+        os.makedirs(cache)
+        with open(os.path.join(cache, 'commit_id'), 'w') as fp:
+            fp.write('foo\n')
+        my_index = index.Index(self._config)
+        self.assertFalse(my_index.load())
+        # the index built is saved to the cache directory
+        self._tree.index()
+        self.assertTrue(my_index.load())
+        self.assertEqual(my_index.rdepends, self._tree.index().rdepends)
+    
+    def test_re_patch(self):
+        patches = [
+            ('001_control-1.0.11.patch', ('001', 'control', '1.0.11')),
+            ('002_io-1.0.patch', ('002', 'io', '1.0')),
+            ('001_pkg-2d-0.1.diff', ('001', 'pkg-2d', '0.1')),
+            ('001_c++-1.0', ('001', 'c++', '1.0')),
+            ('001_control-1.0.11-gcc45.patch', ('001', 'control', '1.0.11')),
+            ('002_foo-1.0_fix.patch', ('002', 'foo', '1.0')),
+        ]
+        for patch, groups in patches:
+            self.assertEqual(index.re_patch.match(patch).groups(), groups)
+        self.assertEqual(index.re_patch.match('control-1.0.11.patch'), None)
+        self.assertEqual(index.re_patch.match('001_control.patch'), None)
+    
     def tearDown(self):
         # removing the temp tree
         utils.clean_env(self._config_file, self._tempdir)
@@ -105,5 +184,11 @@ def suite():
     suite.addTest(TestDescriptionTree('test_package_versions'))
     suite.addTest(TestDescriptionTree('test_latest_version'))
     suite.addTest(TestDescriptionTree('test_version_compare'))
+    suite.addTest(TestDescriptionTree('test_version_key'))
     suite.addTest(TestDescriptionTree('test_description_files'))
+    suite.addTest(TestDescriptionTree('test_load_all'))
+    suite.addTest(TestDescriptionTree('test_rdepends'))
+    suite.addTest(TestDescriptionTree('test_patches'))
+    suite.addTest(TestDescriptionTree('test_index'))
+    suite.addTest(TestDescriptionTree('test_re_patch'))
     return suite
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_distfiles.py
+    ~~~~~~~~~~~~~~~~~
+
+    test suite for the *g_octave.distfiles* module, using a local HTTP
+    server.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import utils
+
+from g_octave import distfiles
+
+
+class Handler(utils.HTTPHandler):
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if not self.path.startswith('/good/'):
+            self.send_error(404)
+            return
+        content = os.path.basename(self.path).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TestDistfiles(unittest.TestCase):
+
+    def setUp(self):
+        self._server = utils.start_server(Handler)
+        self._server.paths = []
+        self._url = self._server.url
+        self._eclass_distfiles = distfiles._eclass_distfiles
+        distfiles._eclass_distfiles = [
+            ('g-octave_Makefile', self._url + '/good/g-octave_Makefile'),
+        ]
+        self._tempdir = tempfile.mkdtemp()
+        self._distdir = os.path.join(self._tempdir, 'distfiles')
+        self._pkgdir = os.path.join(self._tempdir, 'g-octave', 'pkg')
+        os.makedirs(self._pkgdir)
+        self._ebuild = os.path.join(self._pkgdir, 'pkg-1.0.ebuild')
+
+    def test_distfiles(self):
+        self.assertEqual(
+            distfiles.distfiles(self._ebuild, ['http://a/', 'http://b']),
+            [
+                ('pkg-1.0.tar.gz', [
+                    'http://a/octave/pkg-1.0.tar.gz',
+                    'http://b/octave/pkg-1.0.tar.gz',
+                ]),
+                ('g-octave_Makefile', [self._url + '/good/g-octave_Makefile']),
+            ]
+        )
+        self.assertEqual(
+            distfiles.distfiles(os.path.join(self._pkgdir, 'pkg-9999.ebuild')),
+            [('g-octave_Makefile', [self._url + '/good/g-octave_Makefile'])],
+        )
+
+    def test_fetch_distfiles(self):
+        # the first mirror fails, the second one works
+        mirrors = [self._url + '/bad', self._url + '/good']
+        content = b'pkg-1.0.tar.gz'
+        with open(os.path.join(self._pkgdir, 'Manifest'), 'w') as fp:
+            fp.write('DIST pkg-1.0.tar.gz %i SHA256 %s FOO 123\n' % (
+                len(content),
+                hashlib.sha256(content).hexdigest(),
+            ))
+        failed = distfiles.fetch_distfiles(
+            [self._ebuild], self._distdir, mirrors=mirrors
+        )
+        self.assertEqual(failed, [])
+        for filename in ['pkg-1.0.tar.gz', 'g-octave_Makefile']:
+            with open(os.path.join(self._distdir, filename), 'rb') as fp:
+                self.assertEqual(fp.read(), filename.encode('utf-8'))
+        self.assertEqual(len(self._server.paths), 3)
+
+        # already fetched and verified
+        failed = distfiles.fetch_distfiles(
+            [self._ebuild], self._distdir, mirrors=mirrors
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(len(self._server.paths), 3)
+
+    def test_verify(self):
+        with open(os.path.join(self._pkgdir, 'Manifest'), 'w') as fp:
+            fp.write('DIST pkg-1.0.tar.gz 14 SHA256 %s\n' % ('0' * 64))
+        failed = distfiles.fetch_distfiles(
+            [self._ebuild], self._distdir, mirrors=[self._url + '/good']
+        )
+        self.assertEqual(failed, ['pkg-1.0.tar.gz'])
+        self.assertFalse(
+            os.path.exists(os.path.join(self._distdir, 'pkg-1.0.tar.gz'))
+        )
+
+    def tearDown(self):
+        distfiles._eclass_distfiles = self._eclass_distfiles
+        utils.stop_server(self._server)
+        shutil.rmtree(self._tempdir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestDistfiles('test_distfiles'))
+    suite.addTest(TestDistfiles('test_fetch_distfiles'))
+    suite.addTest(TestDistfiles('test_verify'))
+    return suite
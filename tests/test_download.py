@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_download.py
+    ~~~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.download* module, using a local HTTP
+    server.
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import utils
+
+from g_octave import download, exception
+
+
+class Handler(utils.HTTPHandler):
+    
+    def do_GET(self):
+        self.server.clients.append(self.client_address)
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/file/redirected')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if not self.path.startswith('/file/'):
+            self.send_error(404)
+            return
+        content = self.path[len('/file/'):].encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TestDownload(unittest.TestCase):
+    
+    def setUp(self):
+        self._server = utils.start_server(Handler)
+        self._server.clients = []
+        self._url = self._server.url
+        self._downloader = download.Downloader(max_connections=3)
+        self._tempdir = tempfile.mkdtemp()
+    
+    def test_get(self):
+        response = self._downloader.get(self._url + '/file/foo')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.content, b'foo')
+        dest = os.path.join(self._tempdir, 'bar')
+        response = self._downloader.get(self._url + '/file/bar', dest=dest)
+        self.assertEqual(response.filename, dest)
+        with open(dest, 'rb') as fp:
+            self.assertEqual(fp.read(), b'bar')
+        response = self._downloader.get(self._url + '/redirect')
+        self.assertEqual(response.content, b'redirected')
+        self.assertRaises(
+            exception.FetchException,
+            self._downloader.get,
+            self._url + '/foo',
+        )
+    
+    def test_partial(self):
+        # the file can't be saved
+        dest = os.path.join(self._tempdir, 'dir')
+        os.makedirs(os.path.join(dest, 'foo'))
+        self.assertRaises(
+            (exception.FetchException, OSError),
+            self._downloader.get,
+            self._url + '/file/foo',
+            dest = dest,
+        )
+        self.assertFalse(os.path.exists(dest + '.part'))
+    
+    def test_connection_reuse(self):
+        for i in range(5):
+            self._downloader.get(self._url + '/file/%i' % i)
+        self.assertEqual(len(set(self._server.clients)), 1)
+    
+    def test_get_all(self):
+        urls = [self._url + '/file/%i' % i for i in range(10)]
+        urls.append(self._url + '/foo')
+        responses = self._downloader.get_all(urls)
+        for i in range(10):
+            self.assertEqual(responses[i].content, str(i).encode('utf-8'))
+        self.assertTrue(isinstance(responses[10], exception.FetchException))
+        # concurrent downloads, using at most 3 connections
+        self.assertTrue(len(set(self._server.clients)) <= 3)
+    
+    def tearDown(self):
+        self._downloader.close()
+        utils.stop_server(self._server)
+        shutil.rmtree(self._tempdir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestDownload('test_get'))
+    suite.addTest(TestDownload('test_partial'))
+    suite.addTest(TestDownload('test_connection_reuse'))
+    suite.addTest(TestDownload('test_get_all'))
+    return suite
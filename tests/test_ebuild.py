@@ -15,7 +15,7 @@ import os
 import unittest
 import utils
 
-from g_octave import ebuild, overlay
+from g_octave import description_tree, ebuild, overlay
 
 
 class TestEbuild(unittest.TestCase):
@@ -88,6 +88,78 @@ class TestEbuild(unittest.TestCase):
             for i in range(len(created_ebuild)):
                 self.assertEqual(created_ebuild[i], original_ebuild[i])            
     
+    def test_generate_all(self):
+        failed = ebuild.generate_all(
+            conf = self._config,
+            jobs = 2,
+            accept_keywords = 'amd64 ~amd64 x86 ~x86',
+            display_info = False,
+        )
+        self.assertEqual(failed, [])
+        tree = description_tree.DescriptionTree(conf = self._config)
+        for atom in tree.packages():
+            pkgname = atom.rsplit('-', 1)[0]
+            self.assertTrue(os.path.exists(os.path.join(
+                self._config.overlay, 'g-octave', pkgname, atom + '.ebuild'
+            )))
+    
+    def test_resolved(self):
+        def create():
+            resolved = []
+            ebuild.Ebuild('main2-0.0.2', conf = self._config).create(
+                accept_keywords = 'amd64 ~amd64 x86 ~x86',
+                manifest = False,
+                display_info = False,
+                resolved = resolved,
+            )
+            return [os.path.basename(i) for i in resolved]
+        expected = ['main2-0.0.2.ebuild', 'main1-0.0.1.ebuild']
+        self.assertEqual(create(), expected)
+        # the dependencies are resolved even if the ebuilds exist
+        self.assertEqual(create(), expected)
+    
+    def test_install_file(self):
+        src = os.path.join(self._dir, 'src.patch')
+        dest = os.path.join(self._dir, 'dest.patch')
+        with open(src, 'w') as fp:
+            fp.write('foo')
+        
+        # same filesystem, hardlinked
+        ebuild._install_file(src, dest)
+        self.assertTrue(os.path.samefile(src, dest))
+        
+        # same content, kept
+        os.unlink(dest)
+        with open(dest, 'w') as fp:
+            fp.write('foo')
+        inode = os.stat(dest).st_ino
+        ebuild._install_file(src, dest)
+        self.assertEqual(os.stat(dest).st_ino, inode)
+        
+        # different content, replaced
+        with open(src, 'w') as fp:
+            fp.write('bar')
+        ebuild._install_file(src, dest)
+        with open(dest) as fp:
+            self.assertEqual(fp.read(), 'bar')
+    
+    def test_renderer_index(self):
+        tree = description_tree.DescriptionTree(conf = self._config)
+        renderer = ebuild.Renderer(conf = self._config, index = tree.index())
+        self.assertEqual(
+            renderer.patches('main1', '0.0.1'),
+            ['001_main1-0.0.1.patch', '002_main1-0.0.1.patch'],
+        )
+        # the patches come from the index of the tree, not from the cache
+        # directory
+        class Index(object):
+            patches = {'main1-0.0.1': ['003_main1-0.0.1.patch']}
+        renderer = ebuild.Renderer(conf = self._config, index = Index())
+        self.assertEqual(
+            renderer.patches('main1', '0.0.1'),
+            ['003_main1-0.0.1.patch'],
+        )
+    
     def tearDown(self):
         utils.clean_env(self._config_file, self._dir)
     
@@ -96,4 +168,8 @@ def suite():
     suite = unittest.TestSuite()
     suite.addTest(TestEbuild('test_re_keywords'))
     suite.addTest(TestEbuild('test_generated_ebuilds'))
+    suite.addTest(TestEbuild('test_generate_all'))
+    suite.addTest(TestEbuild('test_resolved'))
+    suite.addTest(TestEbuild('test_install_file'))
+    suite.addTest(TestEbuild('test_renderer_index'))
     return suite
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_metadata.py
+    ~~~~~~~~~~~~~~~~
+
+    test suite for the *g_octave.metadata* module
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import hashlib
+import json
+import os
+import unittest
+import utils
+
+from g_octave import ebuild, metadata, overlay
+
+
+class TestMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self._config, self._config_file, self._dir = utils.create_env(json_files=True)
+        overlay.create_overlay(conf = self._config, quiet = True)
+        with open(os.path.join(self._config.overlay, 'eclass', 'g-octave.eclass'), 'rb') as fp:
+            eclass_md5 = hashlib.md5(fp.read()).hexdigest()
+        self._template = {
+            'DEPEND': 'sys-devel/autoconf',
+            'RDEPEND': '',
+            'PDEPEND': '',
+            'IUSE': '',
+            'DEFINED_PHASES': 'install postinst postrm prepare prerm',
+            'INHERIT': 'g-octave eutils',
+            'PROPERTIES': '',
+            'REQUIRED_USE': '',
+            'RESTRICT': 'mirror',
+            'SRC_URI': 'mirror://sourceforge/octave/${P}.tar.gz',
+            '_eclasses_': 'g-octave\t%s' % eclass_md5,
+        }
+        with open(os.path.join(self._config.overlay, 'metadata', 'g-octave.json'), 'w') as fp:
+            json.dump({'stable-patched': self._template}, fp)
+
+    def test_layout(self):
+        with open(os.path.join(self._config.overlay, 'metadata', 'layout.conf')) as fp:
+            self.assertEqual(fp.read(), metadata.layout_conf)
+
+    def test_entry(self):
+        ebuild.Ebuild('main1-0.0.1', conf = self._config).create(
+            accept_keywords = 'amd64 ~amd64 x86 ~x86',
+            manifest = False,
+            display_info = False,
+            nodeps = True,
+        )
+        ebuild_file = os.path.join(
+            self._config.overlay, 'g-octave', 'main1', 'main1-0.0.1.ebuild'
+        )
+        with open(ebuild_file, 'rb') as fp:
+            ebuild_md5 = hashlib.md5(fp.read()).hexdigest()
+        entry = {}
+        with open(os.path.join(self._config.overlay, 'metadata', 'md5-cache', 'g-octave', 'main1-0.0.1')) as fp:
+            for line in fp:
+                key, value = line.rstrip('\n').split('=', 1)
+                entry[key] = value
+        self.assertEqual(entry['_md5_'], ebuild_md5)
+        self.assertEqual(entry['_eclasses_'], self._template['_eclasses_'])
+        self.assertEqual(entry['EAPI'], '3')
+        self.assertEqual(entry['DESCRIPTION'], 'This is the Main 1 description')
+        self.assertEqual(entry['HOMEPAGE'], 'http://main1.org')
+        self.assertEqual(entry['KEYWORDS'], '~amd64 ~x86')
+        self.assertEqual(entry['SRC_URI'], 'mirror://sourceforge/octave/main1-0.0.1.tar.gz')
+        self.assertEqual(entry['RESTRICT'], 'mirror')
+        self.assertEqual(len(entry['DEPEND'].split()), 5)
+        self.assertTrue(entry['DEPEND'].endswith(' sys-devel/autoconf'))
+        self.assertTrue(entry['RDEPEND'].endswith(' >=sci-mathematics/octave-3.0.0'))
+        self.assertFalse('IUSE' in entry)
+
+    def test_egencache(self):
+        os.unlink(os.path.join(self._config.overlay, 'metadata', 'g-octave.json'))
+        entry_file = os.path.join(
+            self._config.overlay, 'metadata', 'md5-cache', 'g-octave', 'main1-0.0.1'
+        )
+        
+        # egencache not found
+        metadata.MetadataCache.egencache = os.path.join(self._dir, 'egencache')
+        ebuild.Ebuild('main1-0.0.1', conf = self._config).create(
+            manifest = False,
+            display_info = False,
+            nodeps = True,
+        )
+        self.assertFalse(os.path.exists(entry_file))
+        
+        args_file = os.path.join(self._dir, 'args')
+        with open(metadata.MetadataCache.egencache, 'w') as fp:
+            fp.write('#!/bin/sh\necho "$@" > %s\nexit 1\n' % args_file)
+        os.chmod(metadata.MetadataCache.egencache, 0o755)
+        ebuild.Ebuild('main1-0.0.1', force = True, conf = self._config).create(
+            manifest = False,
+            display_info = False,
+            nodeps = True,
+        )
+        with open(args_file) as fp:
+            self.assertEqual(
+                fp.read(),
+                '--update --repo=g-octave =g-octave/main1-0.0.1\n',
+            )
+        self.assertFalse(os.path.exists(entry_file))
+
+    def tearDown(self):
+        utils.clean_env(self._config_file, self._dir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestMetadata('test_layout'))
+    suite.addTest(TestMetadata('test_entry'))
+    suite.addTest(TestMetadata('test_egencache'))
+    return suite
@@ -28,6 +28,8 @@ class TestOverlay(unittest.TestCase):
         files = {
             os.path.join(self._config.overlay, 'profiles', 'repo_name'): 'g-octave',
             os.path.join(self._config.overlay, 'profiles', 'categories'): 'g-octave',
+            os.path.join(self._config.overlay, 'metadata', 'layout.conf'):
+                'masters = gentoo\ncache-formats = md5-dict\n',
         }
         for _file in files:
             self.assertTrue(os.path.exists(_file))
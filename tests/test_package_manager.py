@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_package_manager.py
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    test suite for the *g_octave.package_manager* module
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import signal
+import sys
+import threading
+import time
+import unittest
+import utils
+
+from g_octave import ebuild, metadata, overlay, package_manager, vdb
+
+
+class TestBinpkgKeys(unittest.TestCase):
+
+    def setUp(self):
+        self._config, self._config_file, self._dir = utils.create_env(json_files=True)
+        overlay.create_overlay(conf = self._config, quiet = True)
+        self._ebuilds = []
+        for pkg in ['main1-0.0.1', 'extra1-0.0.1']:
+            ebuild.Ebuild(pkg, conf = self._config).create(
+                manifest = False,
+                display_info = False,
+                nodeps = True,
+            )
+            name = pkg.split('-')[0]
+            self._ebuilds.append(os.path.join(
+                self._config.overlay, 'g-octave', name, '%s.ebuild' % pkg
+            ))
+        self._keys_file = os.path.join(self._dir, 'packages', 'g-octave', 'keys.json')
+
+    def test_ebuild_key(self):
+        key = package_manager.ebuild_key(self._ebuilds[0])
+        self.assertEqual(len(key), 40)
+        self.assertNotEqual(key, package_manager.ebuild_key(self._ebuilds[1]))
+        filesdir = os.path.join(os.path.dirname(self._ebuilds[0]), 'files')
+        if not os.path.exists(filesdir):
+            os.makedirs(filesdir)
+        with open(os.path.join(filesdir, 'foo.patch'), 'w') as fp:
+            fp.write('patch')
+        self.assertNotEqual(key, package_manager.ebuild_key(self._ebuilds[0]))
+
+    def test_stale(self):
+        keys = package_manager.BinpkgKeys(self._keys_file)
+        self.assertEqual(keys.stale(self._ebuilds), [
+            'g-octave/main1',
+            'g-octave/extra1',
+        ])
+        keys.update(self._ebuilds[:1])
+        keys = package_manager.BinpkgKeys(self._keys_file)
+        self.assertEqual(keys.stale(self._ebuilds), ['g-octave/extra1'])
+
+        # another ebuild was generated
+        with open(self._ebuilds[0], 'a') as fp:
+            fp.write('\n# changed\n')
+        self.assertEqual(keys.stale(self._ebuilds), [
+            'g-octave/main1',
+            'g-octave/extra1',
+        ])
+
+    def test_merge(self):
+        commands = []
+        class Portage(package_manager.Portage):
+            def run_command(self, command):
+                commands.append(command)
+                return os.EX_OK
+            def _binpkg_keys_file(me):
+                return self._keys_file
+        conf = package_manager.conf
+        package_manager.conf = self._config
+        environ = os.environ.copy()
+        try:
+            pkg_manager = Portage(binpkg=True)
+            pkg_manager.ebuilds = self._ebuilds[1:]
+            pkg_manager.install_package(['=g-octave/main1-0.0.1'], None)
+            # the binary package of extra1 is reused by the next merge
+            pkg_manager.install_package(['=g-octave/main1-0.0.1'], None)
+        finally:
+            package_manager.conf = conf
+            os.environ.clear()
+            os.environ.update(environ)
+        self.assertEqual(commands, [
+            [
+                '--buildpkg', '--usepkg',
+                '--usepkg-exclude', 'g-octave/extra1 g-octave/main1',
+                '=g-octave/main1-0.0.1',
+            ],
+            ['--buildpkg', '--usepkg', '=g-octave/main1-0.0.1'],
+        ])
+
+    def test_cave(self):
+        cave = package_manager.Cave(binpkg=True)
+        command = ['resolve', '=g-octave/main1-0.0.1']
+        self.assertEqual(
+            cave._binpkg_command(command, []),
+            ['resolve', '--via-binary', 'g-octave/*', '=g-octave/main1-0.0.1'],
+        )
+        self.assertEqual(cave._binpkg_command(command, ['g-octave/main1']), command)
+
+    def tearDown(self):
+        utils.clean_env(self._config_file, self._dir)
+
+
+class TestUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self._config, self._config_file, self._dir = utils.create_env(json_files=True)
+        overlay.create_overlay(conf = self._config, quiet = True)
+        vdb_dir = os.path.join(self._dir, 'vdb')
+        for entry in ['extra2-0.0.1', 'main1-0.0.1', 'language1-0.0.1', 'main2-9999']:
+            os.makedirs(os.path.join(vdb_dir, 'g-octave', entry))
+        self._conf = package_manager.conf
+        self._vdb = package_manager.VDB
+        package_manager.conf = self._config
+        package_manager.VDB = lambda conf: vdb.VDB(conf, vdb_dir)
+
+    def test_outdated_packages(self):
+        ebuild.Ebuild('language1-0.0.1', conf = self._config).create(
+            manifest = False,
+            display_info = False,
+            nodeps = True,
+        )
+        # main1 has no stamp (created by an older g-octave), and isn't
+        # merged again
+        self.assertEqual(package_manager.Base().outdated_packages(), [
+            ('g-octave/extra2', False),
+        ])
+        my_metadata = metadata.MetadataCache(self._config)
+        self.assertNotEqual(my_metadata.stamp('main1', '0.0.1'), None)
+        # the sources of main1 changed
+        my_metadata.set_stamp('main1', '0.0.1', 'old')
+        self.assertEqual(package_manager.Base().outdated_packages(), [
+            ('g-octave/extra2', False),
+            ('g-octave/main1', True),
+        ])
+        ebuild.Ebuild('main1-0.0.1', force = True, conf = self._config).create(
+            manifest = False,
+            display_info = False,
+            nodeps = True,
+        )
+        self.assertEqual(package_manager.Base().outdated_packages(), [
+            ('g-octave/extra2', False),
+        ])
+
+    def test_update_all(self):
+        commands = []
+        class Portage(package_manager.Portage):
+            def _run(self, command):
+                commands.append(command)
+                return os.EX_OK
+        ebuild.Ebuild('language1-0.0.1', conf = self._config).create(
+            manifest = False,
+            display_info = False,
+            nodeps = True,
+        )
+        metadata.MetadataCache(self._config).set_stamp('main1', '0.0.1', 'old')
+        environ = os.environ.copy()
+        try:
+            Portage(nocolor=True).update_package()
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+        # main1 changed, and is merged again with the same version
+        self.assertEqual(
+            [i for i in commands if i[0] == Portage._client],
+            [[
+                Portage._client, '--color=n',
+                '--oneshot', 'g-octave/extra2', '=g-octave/main1-0.0.1',
+            ]],
+        )
+
+    def tearDown(self):
+        package_manager.conf = self._conf
+        package_manager.VDB = self._vdb
+        utils.clean_env(self._config_file, self._dir)
+
+
+class TestRun(unittest.TestCase):
+
+    def setUp(self):
+        self._timeout = os.environ.get('GOCTAVE_COMMAND_TIMEOUT')
+
+    def test_return_code(self):
+        self.assertEqual(package_manager.Base()._run([
+            sys.executable, '-c', 'import sys; sys.exit(3)',
+        ]), 3)
+
+    def test_timeout(self):
+        os.environ['GOCTAVE_COMMAND_TIMEOUT'] = '0.5'
+        start = time.time()
+        ret = package_manager.Base()._run([
+            sys.executable, '-c', 'import time; time.sleep(10)',
+        ])
+        self.assertNotEqual(ret, os.EX_OK)
+        self.assertTrue(time.time() - start < 5)
+
+    def test_interrupt(self):
+        # like the SIGINT handler of the g-octave script
+        def handler(signum, frame):
+            sys.exit(1)
+        old_handler = signal.signal(signal.SIGINT, handler)
+        timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGINT))
+        start = time.time()
+        timer.start()
+        try:
+            self.assertRaises(SystemExit, package_manager.Base()._run, [
+                sys.executable, '-c', 'import time; time.sleep(10)',
+            ])
+        finally:
+            timer.cancel()
+            signal.signal(signal.SIGINT, old_handler)
+        # the command was terminated
+        self.assertTrue(time.time() - start < 5)
+
+    def tearDown(self):
+        if self._timeout is None:
+            os.environ.pop('GOCTAVE_COMMAND_TIMEOUT', None)
+        else:
+            os.environ['GOCTAVE_COMMAND_TIMEOUT'] = self._timeout
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestBinpkgKeys('test_ebuild_key'))
+    suite.addTest(TestBinpkgKeys('test_stale'))
+    suite.addTest(TestBinpkgKeys('test_merge'))
+    suite.addTest(TestBinpkgKeys('test_cave'))
+    suite.addTest(TestUpdate('test_outdated_packages'))
+    suite.addTest(TestUpdate('test_update_all'))
+    suite.addTest(TestRun('test_return_code'))
+    suite.addTest(TestRun('test_timeout'))
+    suite.addTest(TestRun('test_interrupt'))
+    return suite
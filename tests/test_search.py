@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_search.py
+    ~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.search* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import unittest
+import utils
+
+from g_octave import description_tree, search
+from g_octave.exception import SearchException
+
+
+class TestSearch(unittest.TestCase):
+    
+    def setUp(self):
+        conf, self._config_file, self._tempdir = utils.create_env()
+        self._tree = description_tree.DescriptionTree(conf = conf)
+        self._search = search.Search(self._tree.index().search)
+    
+    def test_prefix(self):
+        self.assertEqual(
+            self._search.query('name:main'),
+            ['main1', 'main2'],
+        )
+        self.assertEqual(self._search.query('main1'), ['main1'])
+        self.assertEqual(self._search.query('foo'), [])
+    
+    def test_regex(self):
+        self.assertEqual(
+            self._search.query('/^(main|extra)1$/'),
+            ['extra1', 'main1'],
+        )
+        self.assertRaises(SearchException, self._search.query, '/(main/')
+    
+    def test_fields(self):
+        queries = [
+            ('categories:category1', ['extra1', 'language1', 'main1']),
+            ('categories:category3', ['extra2', 'language2', 'main2']),
+            ('description:extra', ['extra1', 'extra2']),
+            ('maintainer:language', ['language1', 'language2']),
+            ('name:category1', []),
+        ]
+        for query, result in queries:
+            self.assertEqual(self._search.query(query), result)
+    
+    def test_ranking(self):
+        # the name matches are better than the other matches (all the
+        # maintainers are "* Maintainer")
+        self.assertEqual(
+            self._search.query('main'),
+            ['main1', 'main2', 'extra1', 'extra2', 'language1', 'language2'],
+        )
+        self.assertEqual(self._search.query('extra 1'), ['extra1'])
+    
+    def test_tree_search(self):
+        packages = self._tree.search('name:main')
+        self.assertEqual([i[0] for i in packages], ['main1', 'main2'])
+        self.assertEqual(packages[1][1], ['0.0.1', '0.0.2', '9999'])
+    
+    def test_postings(self):
+        desc = self._tree['main1-0.0.1']
+        index = search.build_search_index([
+            ('foo', desc),
+            ('foo-2d', desc),
+            ('foo', desc),
+        ])
+        self.assertEqual(index['name']['foo'], ['foo', 'foo-2d'])
+        self.assertEqual(index['description']['main'], ['foo', 'foo-2d'])
+    
+    def tearDown(self):
+        utils.clean_env(self._config_file, self._tempdir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestSearch('test_prefix'))
+    suite.addTest(TestSearch('test_regex'))
+    suite.addTest(TestSearch('test_fields'))
+    suite.addTest(TestSearch('test_ranking'))
+    suite.addTest(TestSearch('test_tree_search'))
+    suite.addTest(TestSearch('test_postings'))
+    return suite
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_tinderbox.py
+    ~~~~~~~~~~~~~~~~~
+
+    test suite for the tinderbox (*contrib/tinderbox.py*), using the local
+    reporter.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import gzip
+import hashlib
+import os
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import unittest
+import utils
+
+from g_octave import api
+from g_octave.compat import py3k
+
+# the tinderbox is a Python 2 script
+if py3k:
+    raise ImportError('The tinderbox requires Python 2')
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'contrib'
+))
+
+import tinderbox
+
+
+class TestReports(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._packdir = os.path.join(self._tempdir, 'reports')
+        self._reports = os.path.join(self._tempdir, 'reports.db')
+        self._logs = {}
+        for atom in ['main1-0.0.1', 'main2-0.0.1', 'extra1-0.0.1']:
+            self._logs[atom] = os.path.join(self._tempdir, '%s.log' % atom)
+            with open(self._logs[atom], 'w') as fp:
+                fp.write('building %s\nerror: failed\n' % atom)
+
+    def _reported(self):
+        conn = sqlite3.connect(self._reports)
+        try:
+            return sorted([i[0] for i in conn.execute('SELECT atom FROM reports')])
+        finally:
+            conn.close()
+
+    def test_batches(self):
+        batches = []
+        class Reporter(tinderbox.LocalReporter):
+            def report(self, failures):
+                batches.append(len(failures))
+                return tinderbox.LocalReporter.report(self, failures)
+        queue = tinderbox.ReportQueue(
+            Reporter(self._reports), self._packdir, batch_size=2, wait=1,
+        )
+        for atom in sorted(self._logs):
+            queue.put(atom, [self._logs[atom]], 'fp-%s' % atom)
+        queue.start()
+        queue.close()
+        self.assertEqual(batches, [2, 1])
+        self.assertEqual(self._reported(), sorted(self._logs))
+        self.assertEqual(queue.reported, dict([
+            (atom, 'fp-%s' % atom) for atom in self._logs
+        ]))
+        self.assertTrue(os.path.exists(
+            os.path.join(self._packdir, 'main1-0.0.1.log.gz')
+        ))
+
+    def test_errors(self):
+        calls = []
+        class Reporter(tinderbox.LocalReporter):
+            def report(self, failures):
+                calls.append(failures)
+                if len(calls) == 1:
+                    raise tinderbox.TracError('unavailable')
+                return tinderbox.LocalReporter.report(self, failures)
+        queue = tinderbox.ReportQueue(
+            Reporter(self._reports), self._packdir, batch_size=2, wait=1,
+        )
+        for atom in sorted(self._logs):
+            queue.put(atom, [self._logs[atom]], 'fp-%s' % atom)
+        queue.start()
+        queue.close()
+        # the failed batch isn't reported, the next one is
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self._reported(), ['main2-0.0.1'])
+        self.assertEqual(queue.reported, {'main2-0.0.1': 'fp-main2-0.0.1'})
+
+    def test_fingerprint(self):
+        log = os.path.join(self._tempdir, 'build.log')
+        def fingerprint(content):
+            with open(log, 'w') as fp:
+                fp.write(content)
+            return tinderbox.log_fingerprint([log])
+        error = fingerprint('make[1]: pid 123\nfoo.cc:12: error: bar\n')
+        # the same error, with other numbers
+        self.assertEqual(
+            error, fingerprint('make[2]: pid 456\nfoo.cc:34: error: bar\n')
+        )
+        self.assertNotEqual(
+            error, fingerprint('make[1]: pid 123\nfoo.cc:12: error: baz\n')
+        )
+        # only the last lines are used
+        self.assertEqual(
+            fingerprint('foo\n' + 'bar\n' * 30),
+            fingerprint('baz\n' + 'bar\n' * 30),
+        )
+
+    def test_pack_log(self):
+        log = os.path.join(self._tempdir, 'build.log')
+        lines = ['line %i\n' % i for i in range(100)]
+        lines[50] = 'foo.cc:12: error: bar\n'
+        with open(log, 'w') as fp:
+            fp.writelines(lines)
+        dest, digest = tinderbox.pack_log(
+            log, self._tempdir, head=5, context=3, tail=4,
+        )
+        fp = gzip.open(dest)
+        try:
+            content = fp.read()
+        finally:
+            fp.close()
+        marker = '[... lines removed by the tinderbox ...]\n'
+        self.assertEqual(content, ''.join(
+            lines[:5] + [marker] + lines[47:54] + [marker] + lines[-4:]
+        ))
+        self.assertEqual(digest, hashlib.sha1(content).hexdigest())
+
+    def test_re_error(self):
+        log = os.path.join(self._tempdir, 'build.log')
+        lines = [
+            '>>> Emerging (1 of 1) g-octave/main1-0.0.1\n',
+            'checking for error.h... yes\n',
+            'checking for strerror... yes\n',
+            'g++ -Wall -Werror -c error_handler.cc\n',
+            'foo.cc: In function \'int bar()\':\n',
+            'foo.cc:12: error: \'baz\' was not declared in this scope\n',
+            'make: *** [foo.o] Error 1\n',
+            'error: unable to build the package\n',
+            ' * ERROR: g-octave/main1-0.0.1 failed (install phase):\n',
+        ]
+        for line in lines[:5]:
+            self.assertEqual(tinderbox.re_error.search(line), None)
+        for line in lines[5:]:
+            self.assertNotEqual(tinderbox.re_error.search(line), None)
+        with open(log, 'w') as fp:
+            fp.writelines(lines)
+        dest, digest = tinderbox.pack_log(
+            log, self._tempdir, head=1, context=1, tail=1,
+        )
+        fp = gzip.open(dest)
+        try:
+            content = fp.read()
+        finally:
+            fp.close()
+        # the context is around the first real error
+        marker = '[... lines removed by the tinderbox ...]\n'
+        self.assertEqual(content, ''.join(
+            lines[:1] + [marker] + lines[4:7] + [marker] + lines[-1:]
+        ))
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+
+class TestState(unittest.TestCase):
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._filename = os.path.join(self._tempdir, 'state.json')
+
+    def test_resume(self):
+        state = tinderbox.State(self._filename)
+        self.assertEqual(state.resume('commit1'), None)
+        state.start('commit1', ['main1-0.0.1', 'main2-0.0.1', 'extra1-0.0.1'])
+        state.done('main1-0.0.1')
+
+        # interrupted
+        state = tinderbox.State(self._filename)
+        self.assertEqual(state.resume('commit1'), ['main2-0.0.1', 'extra1-0.0.1'])
+        self.assertEqual(state.resume('commit2'), None)
+        state.done('main2-0.0.1')
+        state.done('extra1-0.0.1')
+        state.finish()
+
+        state = tinderbox.State(self._filename)
+        self.assertEqual(state.commit_id, 'commit1')
+        self.assertEqual(state.resume('commit1'), None)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+
+class TestPackages(unittest.TestCase):
+
+    def setUp(self):
+        conf, self._config_file, self._tempdir = utils.create_env(json_files=True)
+        self._query = tinderbox.Query
+        tinderbox.Query = lambda: api.Query(conf)
+        self._packages = [i['atom'] for i in api.Query(conf).list_raw()]
+
+    def test_changed_packages(self):
+        digests = dict([(i, 'digest-%s' % i) for i in self._packages])
+        state = tinderbox.State(os.path.join(self._tempdir, 'state.json'))
+        self.assertEqual(
+            tinderbox.changed_packages(digests, state), sorted(self._packages)
+        )
+        for atom in self._packages:
+            state.packages[atom] = {'digest': digests[atom], 'result': 'ok'}
+        self.assertEqual(tinderbox.changed_packages(digests, state), [])
+        # main1 changed: the packages that depend on it are built again
+        digests['main1-0.0.1'] = 'changed'
+        self.assertEqual(tinderbox.changed_packages(digests, state), [
+            'extra2-0.0.2', 'language2-0.0.2', 'main1-0.0.1', 'main2-0.0.2',
+        ])
+
+    def test_dependency_levels(self):
+        self.assertEqual(tinderbox.dependency_levels(self._packages), [
+            [
+                'extra1-0.0.1', 'extra2-0.0.1', 'language1-0.0.1',
+                'language2-0.0.1', 'main1-0.0.1', 'main2-0.0.1',
+            ],
+            ['extra2-0.0.2', 'main2-0.0.2'],
+            ['language2-0.0.2'],
+        ])
+
+    def tearDown(self):
+        tinderbox.Query = self._query
+        utils.clean_env(self._config_file, self._tempdir)
+
+
+class TestBuilder(unittest.TestCase):
+
+    def setUp(self):
+        conf, self._config_file, self._tempdir = utils.create_env(json_files=True)
+        self._query = tinderbox.Query
+        self._client = tinderbox.g_octave_client
+        tinderbox.Query = lambda: api.Query(conf)
+        client = os.path.join(self._tempdir, 'g-octave')
+        with open(client, 'w') as fp:
+            fp.write('#!/bin/sh\necho " * Distfiles fetched in 1.25 seconds"\n')
+        os.chmod(client, 0o755)
+        tinderbox.g_octave_client = lambda: client
+        self._workdir = os.path.join(self._tempdir, 'work')
+
+    def test_build(self):
+        builder = tinderbox.Builder(1, self._workdir, self._workdir)
+        atom, return_code, logs, stats = builder.build('main1-0.0.1')
+        self.assertEqual(return_code, os.EX_OK)
+        self.assertEqual(logs, [os.path.join(self._workdir, 'main1-0.0.1.log')])
+        self.assertEqual(stats['fetch_time'], 1.25)
+        self.assertEqual(
+            sorted(stats), ['cpu_time', 'fetch_time', 'max_rss', 'wall_time']
+        )
+
+    def test_stopped(self):
+        class Builder(tinderbox.Builder):
+            def _run(self, args, env, fp):
+                ret = tinderbox.Builder._run(self, args, env, fp)
+                # stopped after the fetch
+                self.stopped = True
+                return ret
+        builder = Builder(1, self._workdir, self._workdir)
+        atom, return_code, logs, stats = builder.build('main1-0.0.1')
+        self.assertEqual(return_code, -signal.SIGTERM)
+        self.assertEqual(stats, {'fetch_time': 1.25})
+
+    def tearDown(self):
+        tinderbox.Query = self._query
+        tinderbox.g_octave_client = self._client
+        utils.clean_env(self._config_file, self._tempdir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestReports('test_batches'))
+    suite.addTest(TestReports('test_errors'))
+    suite.addTest(TestReports('test_fingerprint'))
+    suite.addTest(TestReports('test_pack_log'))
+    suite.addTest(TestReports('test_re_error'))
+    suite.addTest(TestState('test_resume'))
+    suite.addTest(TestPackages('test_changed_packages'))
+    suite.addTest(TestPackages('test_dependency_levels'))
+    suite.addTest(TestBuilder('test_build'))
+    suite.addTest(TestBuilder('test_stopped'))
+    return suite
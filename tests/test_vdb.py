@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    test_vdb.py
+    ~~~~~~~~~~~
+
+    test suite for the *g_octave.vdb* module
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import shutil
+import unittest
+import utils
+
+from g_octave import vdb
+
+
+class TestVDB(unittest.TestCase):
+
+    def setUp(self):
+        self._config, self._config_file, self._tempdir = utils.create_env(json_files=True)
+        self._vdb_dir = os.path.join(self._tempdir, 'vdb')
+        self._cache_file = os.path.join(self._config.db, 'cache', 'vdb.json')
+        for entry in ['main1-0.0.1', 'extra1-1.2.3-r1', '-MERGING-main2-0.0.1']:
+            os.makedirs(os.path.join(self._vdb_dir, 'g-octave', entry))
+
+    def test_packages(self):
+        self.assertEqual(vdb.VDB(self._config, self._vdb_dir).packages(), [
+            {'name': 'extra1', 'version': '1.2.3'},
+            {'name': 'main1', 'version': '0.0.1'},
+        ])
+        self.assertTrue(os.path.exists(self._cache_file))
+
+    def test_cache(self):
+        my_vdb = vdb.VDB(self._config, self._vdb_dir)
+        my_vdb.packages()
+        # the cache is used while the VDB directory isn't changed
+        my_vdb._scan = None
+        self.assertEqual(len(my_vdb.packages()), 2)
+        del my_vdb._scan
+        shutil.rmtree(os.path.join(self._vdb_dir, 'g-octave', 'main1-0.0.1'))
+        os.utime(os.path.join(self._vdb_dir, 'g-octave'), (0, 0))
+        self.assertEqual(my_vdb.packages(), [
+            {'name': 'extra1', 'version': '1.2.3'},
+        ])
+
+    def test_empty(self):
+        shutil.rmtree(self._vdb_dir)
+        self.assertEqual(vdb.VDB(self._config, self._vdb_dir).packages(), [])
+
+    def tearDown(self):
+        utils.clean_env(self._config_file, self._tempdir)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestVDB('test_packages'))
+    suite.addTest(TestVDB('test_cache'))
+    suite.addTest(TestVDB('test_empty'))
+    return suite
@@ -15,23 +15,38 @@ from g_octave.compat import py3k, open
 
 if py3k:
     import configparser
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
 else:
     import ConfigParser as configparser
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
 import os
 import shutil
 import tempfile
+import threading
 
-from g_octave import config
+from g_octave import config, metadata
+
+# the command that generates the metadata cache templates
+_egencache = metadata.MetadataCache.egencache
 
 def create_env(json_files=False):
     """returns a tuple with the *g_octave.config* object and the path of
     the temporary config and directory
     """
     
+    # egencache isn't called by the tests
+    metadata.MetadataCache.egencache = None
+    
     config_file = tempfile.mkstemp(suffix='.cfg')[1]
     directory = tempfile.mkdtemp()
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    db = os.path.join(current_dir, 'files')
+    
+    # the package database is copied, because the caches (index, VDB) are
+    # written to it
+    db = os.path.join(directory, 'db')
+    shutil.copytree(os.path.join(current_dir, 'files'), db)
     overlay = os.path.join(directory, 'overlay')
     
     cp = configparser.ConfigParser()
@@ -51,5 +66,37 @@ def create_env(json_files=False):
     return conf, config_file, directory
     
 def clean_env(config_file, directory):
+    metadata.MetadataCache.egencache = _egencache
     os.unlink(config_file)
     shutil.rmtree(directory)
+
+
+class HTTPHandler(BaseHTTPRequestHandler):
+    """base class of the request handlers of the local HTTP servers."""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    
+    daemon_threads = True
+
+
+def start_server(handler):
+    """starts a local HTTP server on a thread, and returns it. its base
+    URL is the attribute *url*.
+    """
+    
+    server = Server(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    server.url = 'http://127.0.0.1:%i' % server.server_address[1]
+    return server
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()